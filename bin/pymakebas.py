@@ -10,9 +10,10 @@ Converted to Python while maintaining exact interface compatibility.
 import sys
 import os
 import struct
-import math
 import getopt
-from typing import List, Tuple, Optional
+import re
+from functools import lru_cache
+from typing import Iterator, List, Tuple, Optional
 
 DEFAULT_OUTPUT = "out.tap"
 
@@ -126,21 +127,148 @@ tokens = [
     ("spectrum", ""),
 ]
 
+
+
+def _compile_tokens() -> List[Tuple[int, bytes, int, bool]]:
+    """
+    Flatten the token table into (toknum, lowercase bytes, length, is_operator)
+    entries, in search order, with empty alternatives dropped.
+    """
+    compiled = []
+    # The table runs down the character set from COPY (255), one entry per token
+    for toknum, token_pair in zip(range(255, 0, -1), tokens):
+        # Undo the VAL/VAL$ flip
+        if toknum == VAL_TOKEN_NUM:
+            toknum = VALSTR_TOKEN_NUM
+        elif toknum == VALSTR_TOKEN_NUM:
+            toknum = VAL_TOKEN_NUM
+
+        for token_str in token_pair:
+            if not token_str:
+                continue
+            toklen = len(token_str)
+            # <>, <= and >= may be written directly against other characters
+            is_op = token_str[0] == '<' or (toklen > 1 and token_str[1] == '=')
+            compiled.append((toknum, token_str.lower().encode('latin-1'), toklen, is_op))
+
+    return compiled
+
+
+TOKENS_COMPILED = _compile_tokens()
+
+
+def _compile_token_scanner() -> Tuple["re.Pattern[bytes]", dict]:
+    """
+    Build a single regex that reports every keyword occurring in a line, and a
+    map from each keyword to the TOKENS_COMPILED indices it may stand for.
+
+    The regex is a lookahead, so a match is reported at every position, with
+    alternatives grouped by first byte. Only one alternative is reported per
+    position, but keywords starting at the same position are always prefixes
+    of one another, so each match stands for its whole prefix family.
+    """
+    by_first = {}
+    for _, token_bytes, _, _ in TOKENS_COMPILED:
+        by_first.setdefault(token_bytes[:1], []).append(token_bytes)
+    pattern = b'(?=(' + b'|'.join(
+        re.escape(first) + b'(?:' + b'|'.join(re.escape(t[1:]) for t in group) + b')'
+        for first, group in by_first.items()) + b'))'
+
+    families = {}
+    for _, token_bytes, _, _ in TOKENS_COMPILED:
+        families[token_bytes] = tuple(
+            idx for idx, (_, other, _, _) in enumerate(TOKENS_COMPILED)
+            if other.startswith(token_bytes) or token_bytes.startswith(other))
+
+    return re.compile(pattern), families
+
+
+_TOKEN_SCAN_RE, _TOKEN_FAMILIES = _compile_token_scanner()
+
 MAX_LABELS = 2000
 MAX_LABEL_LEN = 16
 MAX_LINE_NUMBER_LEN = 4  # 9999 is the longest (4 chars).
 
+# isalpha() in the C locale, indexed by byte (never true for bytes >= 128)
+_IS_ALPHA = bytes(1 if 65 <= c <= 90 or 97 <= c <= 122 else 0 for c in range(256))
+
+# A run of spaces absorbed after a keyword
+_SPACES_RE = re.compile(b' *')
+
+# Byte translation for the lowercase token comparison copy of a line
+_LOWER_TABLE = bytes(ord(chr(c).lower()) for c in range(256))
+
+# Characters the output loop tests for, as byte values
+(_DQUOTE, _BACKSLASH, _SPACE, _PERCENT, _COLON,
+ _LBRACE, _RBRACE, _EQUALS, _COMMA, _RPAREN) = b'"\\ %:{}=,)'
+
+# Line prefixes: leading whitespace, a line number, and a label definition
+_WS_RE = re.compile(rb'\s*')
+_IS_NUM_RE = re.compile(r'\s*\d+\s*', re.ASCII)
+_LINENUM_RE = re.compile(rb'\s*(\d+)\s*')
+_LABEL_DEF_RE = re.compile(rb'@([^:]*):\s*')
+# A label reference runs until a character outside '!'..'~', or a ':'
+_LABEL_REF_RE = re.compile(rb'[!-9;-~]*')
+
+# Bytes that end a literal run inside quotes or a REM: a quote, an escape,
+# or a DEF FN/REM token byte (which change the output state)
+_LITERAL_STOP_RE = re.compile(b'[' + re.escape(bytes([ord('"'), ord('\\'), DEFFN_TOKEN_NUM, REM_TOKEN_NUM])) + b']')
+
+# Bytes that need attention in code outside quotes: a quote, an escape, the
+# start of a %command, anything that can begin a number, and the tokens that
+# change the output state (BIN is followed by its own number syntax)
+_PLAIN_CODE_RE = re.compile(b'[^' + re.escape(b'"\\%.+-0123456789' + bytes([DEFFN_TOKEN_NUM, REM_TOKEN_NUM, BIN_TOKEN_NUM])) + b']+')
+
+# A %extension command runs up to and including the next ':', or up to a quote
+_PERCENT_CMD_RE = re.compile(rb'%[^":]*:?')
+
+# Bytes a number literal can start with
+_IS_NUM_START = bytes(1 if chr(c) in '0123456789.+-' else 0 for c in range(256))
+
+# A decimal number literal: optional sign, digits, optional decimal point and
+# more digits, optional exponent
+_NUM_RE = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+
+# Digit runs for BIN numbers (hex is introduced by a lowercase "0x" only)
+_HEX_RE = re.compile(rb'[0-9a-fA-F]+')
+_BIN_RE = re.compile(rb'[01]+')
+
+# Escapes \a to \u (either case) are the UDGs, from 144 onwards
+_ESC_UDG = bytes(144 + (c | 0x20) - ord('a') if 65 <= c <= 85 or 97 <= c <= 117 else 0
+                 for c in range(256))
+# Other single-character escapes (\* is the copyright symbol)
+_ESC_SPECIAL = {ord('\\'): ord('\\'), ord('@'): ord('@'), ord('*'): 127}
+
+# Block graphics escapes: the two characters after the backslash are the left
+# and right halves of the cell (' top quadrant, . bottom, : both)
+_BLOCK_GRAPHICS = {pattern: 128 + f for f, pattern in enumerate([
+    "  ", " '", "' ", "''", " .", " :", "'.", "':",
+    ". ", ".'", ": ", ":'", "..", ".:", ":.", "::",
+])}
+
+# Inline number: 0x0e marker, exponent byte, then the 4-byte mantissa
+_INLINE_NUMBER_PACK = struct.Struct('>BBI').pack
+
+# Inline number slot left after each DEF FN parameter, filled in by the ROM
+_DEFFN_PLACEHOLDER = b'\x0e\x00\x00\x00\x00\x00'
+
 # Buffer sizes - using larger non-MSDOS sizes
 FILEBUF_SIZE = 49152
 BUF_SIZE = 8 * 49152
 OUTBUF_SIZE = 49152
 
 
-class Node:
-    """Linked list node for tracking line numbers"""
-    def __init__(self, number: int):
-        self.number = number
-        self.next: Optional['Node'] = None
+# Option errors reported from more than one place
+_ERR_AUTOSTART = "Auto-start line must be in the range 0 to 9999."
+_ERR_INCR = "Label line incr. must be in the range 1 to 1000."
+_ERR_START = "Label start line must be in the range 0 to 9999."
+_ERR_FILENAME = "Filename too long"
+
+
+def _die(msg: str):
+    """Report a fatal error on stderr and exit with status 1"""
+    sys.stderr.write(msg + '\n')
+    sys.exit(1)
 
 
 class OutputFormat:
@@ -149,6 +277,7 @@ class OutputFormat:
     PLUS3DOS = 2
 
 
+@lru_cache(maxsize=4096)
 def dbl2spec(num: float) -> Tuple[bool, int, int]:
     """
     Converts a double to an inline-basic-style speccy FP number.
@@ -167,37 +296,27 @@ def dbl2spec(num: float) -> Tuple[bool, int, int]:
         # It appears that the sign bit is always left as 0 when floating-point
         # numbers are embedded in programs, and the speccy appears to use the
         # '-' character to determine negativity - tests confirm this.
-        # As such, we *completely ignore* the sign of the number.
-        num = abs(num)
-
-        # binary standard form goes from 0.50000... to 0.9999...(dec)
-        exp = 0
-        while num >= 1.0:
-            num /= 2.0
-            exp += 1
+        # As such, we *completely ignore* the sign of the number (the sign bit
+        # is simply not extracted below).
+        bits = struct.unpack('>Q', struct.pack('>d', num))[0]
 
-        while num < 0.5:
-            num *= 2.0
-            exp -= 1
+        # binary standard form goes from 0.50000... to 0.9999...(dec), which is
+        # one more than the IEEE754 exponent (1.xxx form)
+        exp = ((bits >> 52) & 0x7FF) - 1022
 
         # check the range of exp... -128 <= exp <= 127
+        # (this also rejects denormals, whose IEEE754 exponent is 0)
         if exp < -128 or exp > 127:
             return (False, 0, 0)
 
         exp = 128 + exp
 
-        # roll the bits off the mantissa
-        num *= 2.0  # make it so that the 0.5ths bit is the integer part
-
-        man = 0
-        for f in range(32):
-            man <<= 1
-            man |= int(num)
-            num -= int(num)
-            num *= 2.0
+        # take the top 32 bits of the 53-bit significand (implicit 1 included)
+        significand = (bits & 0xFFFFFFFFFFFFF) | 0x10000000000000
+        man = significand >> 21
 
         # round up if needed
-        if int(num) and man != 0xFFFFFFFF:
+        if (significand >> 20) & 1 and man != 0xFFFFFFFF:
             man += 1
 
         # zero out the top bit
@@ -206,139 +325,244 @@ def dbl2spec(num: float) -> Tuple[bool, int, int]:
     return (True, exp, man)
 
 
-def grok_hex(ptr: str, textlinenum: int) -> Tuple[int, str]:
-    """Parse hexadecimal number starting with 0x"""
-    hexits = "0123456789abcdefABCDEF"
-    v = 0
+def _inline_number(num: float, textlinenum: int) -> bytes:
+    """Return the 0x0e marker and 5-byte inline FP form that follows a number"""
+    success, num_exp, num_mantissa = dbl2spec(num)
+    if not success:
+        _die(f"line {textlinenum}: exponent out of range (number too big)")
+    return _INLINE_NUMBER_PACK(0x0e, num_exp, num_mantissa)
 
-    if len(ptr) < 2 or ptr[:2] != "0x":
-        print(f"line {textlinenum}: bad BIN 0x... number", file=sys.stderr)
-        sys.exit(1)
 
-    ptr = ptr[2:]
-    if not ptr or ptr[0] not in hexits:
-        print(f"line {textlinenum}: bad BIN 0x... number", file=sys.stderr)
-        sys.exit(1)
+def _emit_run(outbuf: bytearray, run: bytearray, delete: bytes, textlinenum: int):
+    """
+    Append run to outbuf minus the bytes in delete, failing the same way the
+    byte-at-a-time output loop would if the line gets too big on the way.
+    """
+    text = run.translate(None, delete)
+    last = len(outbuf) + len(text)
+    if run[-1] not in delete:
+        last -= 1
+    if last > OUTBUF_SIZE - 10:
+        _die(f"line {textlinenum}: line too big")
+    outbuf += text
 
-    i = 0
-    while i < len(ptr) and ptr[i] in hexits:
-        n = hexits.index(ptr[i])
-        if n > 15:
-            n -= 6
-        v = v * 16 + n
-        i += 1
 
-    return (v, ptr[i:])
+def grok_hex(line: bytes, pos: int, textlinenum: int) -> Tuple[int, int]:
+    """Parse hexadecimal number starting with 0x at line[pos:], returning (value, end)"""
+    m = _HEX_RE.match(line, pos + 2) if line.startswith(b"0x", pos) else None
+    if m is None:
+        _die(f"line {textlinenum}: bad BIN 0x... number")
 
+    return (int(m.group(0), 16), m.end())
 
-def grok_binary(ptr: str, textlinenum: int) -> Tuple[int, str]:
-    """Parse binary number"""
-    ptr = ptr.lstrip()
 
-    if not ptr or (ptr[0] != '0' and ptr[0] != '1'):
-        print(f"line {textlinenum}: bad BIN number", file=sys.stderr)
-        sys.exit(1)
+def grok_binary(line: bytes, pos: int, textlinenum: int) -> Tuple[int, int]:
+    """Parse binary number at line[pos:], returning (value, end)"""
+    pos = _WS_RE.match(line, pos).end()
 
-    if len(ptr) > 1 and (ptr[1] == 'x' or ptr[1] == 'X'):
-        return grok_hex(ptr, textlinenum)
+    if line[pos:pos + 1] not in (b'0', b'1'):
+        _die(f"line {textlinenum}: bad BIN number")
 
-    v = 0
-    i = 0
-    while i < len(ptr) and (ptr[i] == '0' or ptr[i] == '1'):
-        v *= 2
-        v += ord(ptr[i]) - ord('0')
-        i += 1
+    if line[pos + 1:pos + 2] in (b'x', b'X'):
+        return grok_hex(line, pos, textlinenum)
 
-    return (v, ptr[i:])
+    m = _BIN_RE.match(line, pos)
+    return (int(m.group(0), 2), m.end())
 
 
-class QuoteTokList:
-    """Linked list for tracking line numbers that need tokenization within quotes"""
-    def __init__(self):
-        self.head: Optional[Node] = None
-        self.curr: Optional[Node] = None
+def is_number(string: str) -> bool:
+    """Return True if string is a valid number, False otherwise - matches C version"""
+    return _IS_NUM_RE.fullmatch(string) is not None
 
-    def add_no_dupes(self, word: str) -> Node:
-        """Add line number to list if not already present"""
-        num = int(word)
-        tmp = self.head
 
-        while tmp:
-            if tmp.number == num:
-                return tmp  # reject duplicate line number
-            tmp = tmp.next
+def grok_block(ptr: str, textlinenum: int) -> int:
+    """Parse block graphics escape sequence"""
+    block_val = _BLOCK_GRAPHICS.get(ptr[1:3]) if len(ptr) >= 3 else None
+    if block_val is None:
+        _die(f"line {textlinenum}: invalid block graphics escape")
 
-        ptr = Node(num)
-        ptr.next = None
+    return block_val
 
-        if self.head:
-            self.curr.next = ptr
-        else:
-            self.head = ptr
-        self.curr = ptr
-
-        return ptr
-
-    def search(self, current_line_number: int) -> bool:
-        """Search for line number in list"""
-        ptr = self.head
-        while ptr:
-            if current_line_number == ptr.number:
-                return True
-            ptr = ptr.next
-        return False
-
-    def free(self):
-        """Free all nodes"""
-        ptr = self.head
-        while ptr:
-            tmp = ptr.next
-            ptr = None
-            ptr = tmp
-        self.head = None
-        self.curr = None
 
+def _find_rem(linestart: bytearray, lcasebuf: bytearray) -> Optional[int]:
+    """
+    Find the first standalone REM in the line and replace it with the REM token.
 
-def is_number(string: str) -> bool:
-    """Return True if string is a valid number, False otherwise - matches C version"""
-    try:
-        end_idx = 0
-        # Skip leading whitespace
-        while end_idx < len(string) and string[end_idx].isspace():
-            end_idx += 1
-        if end_idx >= len(string):
-            return False
-
-        # Try to parse as integer
-        val = int(string[end_idx:])
-        # Check remaining characters are only whitespace
-        remaining = string[end_idx + len(str(val)):]
-        for c in remaining:
-            if not c.isspace():
-                return False
-        return True
-    except ValueError:
-        return False
+    Returns the index of the REM token, or None if the line has no REM.
+    """
+    n = len(lcasebuf)
+    pos = 0
+    while True:
+        pos = lcasebuf.find(b"rem", pos)
+        if pos == -1:
+            return None
+        # Check boundaries
+        if (pos == 0 or not _IS_ALPHA[lcasebuf[pos - 1]]) and \
+                (pos + 3 >= n or not _IS_ALPHA[lcasebuf[pos + 3]]):
+            # Mark REM token and following chars, absorbing one trailing space
+            end = pos + 4 if pos + 3 < n and linestart[pos + 3] == ord(' ') else pos + 3
+            linestart[pos] = REM_TOKEN_NUM
+            lcasebuf[pos] = REM_TOKEN_NUM
+            linestart[pos + 1:end] = lcasebuf[pos + 1:end] = b'\x01' * (end - pos - 1)
+            return pos
+        pos += 1
+
+
+def _tokenize_keywords(linestart: bytearray, lcasebuf: bytearray,
+                       remptr_idx: Optional[int], percent_mask: bytearray) -> None:
+    """Replace BASIC keywords in linestart (and lcasebuf) with their token bytes"""
+    # C code: strstr stops at null terminator, so REM prevents tokenization after it
+    end = len(lcasebuf) if remptr_idx is None else remptr_idx
+    n = len(lcasebuf)
+
+    # Narrow the search to keywords that actually occur in the line; they are
+    # still claimed in table order, so priorities are unchanged.
+    candidates = set()
+    for token_bytes in set(_TOKEN_SCAN_RE.findall(lcasebuf, 0, end)):
+        candidates.update(_TOKEN_FAMILIES[token_bytes])
+
+    for idx in sorted(candidates):
+        toknum, token_bytes, toklen, is_op = TOKENS_COMPILED[idx]
+        # Find all occurrences
+        pos = lcasebuf.find(token_bytes, 0, end)
+        while pos != -1:
+            if percent_mask[pos]:
+                pos = lcasebuf.find(token_bytes, pos + toklen, end)
+                continue
 
+            # Check it's not in the middle of a word (except for <>, <=, >=)
+            # C code: (*tarrptr)[0] == '<' || (*tarrptr)[1] == '=' || (!isalpha(ptr[-1]) && !isalpha(ptr[toklen]))
+            nxt = pos + toklen
+            if is_op or ((pos == 0 or not _IS_ALPHA[lcasebuf[pos - 1]]) and
+                         (nxt >= n or not _IS_ALPHA[lcasebuf[nxt]])):
+                # Replace token, marking the rest of it and any trailing
+                # spaces as deleted (0x01)
+                f = _SPACES_RE.match(linestart, nxt).end()
+                linestart[pos] = toknum
+                lcasebuf[pos] = toknum
+                linestart[pos + 1:f] = lcasebuf[pos + 1:f] = b'\x01' * (f - pos - 1)
+
+                # Special handling for BIN token
+                if toknum == BIN_TOKEN_NUM:
+                    linestart[pos] = 1
+                    lcasebuf[pos] = 1
+                    linestart[f - 1] = toknum
+                    lcasebuf[f - 1] = toknum
+
+            pos = lcasebuf.find(token_bytes, nxt, end)
+
+
+def _split_lines(text: bytes) -> List[Tuple[int, bytes]]:
+    """
+    Split the input into lines, skipping blank lines and shell-style comments
+    and joining backslash-continued lines.
 
-def grok_block(ptr: str, textlinenum: int) -> int:
-    """Parse block graphics escape sequence"""
-    lookup = [
-        "  ", " '", "' ", "''", " .", " :", "'.", "':",
-        ". ", ".'", ": ", ":'", "..", ".:", ":.", "::",
-    ]
+    Returns (textlinenum, line) pairs, numbered by the last input line used.
+    """
+    raw_lines = text.split(b'\n')
+    if raw_lines[-1] == b'':
+        raw_lines.pop()  # nothing after the final newline
+
+    lines = []
+    textlinenum = 0
+    raw_iter = iter(raw_lines)
+    for line in raw_iter:
+        textlinenum += 1
+
+        # Allow shell-style comments and ignore blank lines
+        if not line or line[0] == ord('#'):
+            continue
+
+        # Handle line continuation
+        while line.endswith(b'\\'):
+            cont_line = next(raw_iter, None)
+            if cont_line is None:
+                line = line[:-1]  # remove backslash on EOF
+                break
+            textlinenum += 1
+            line = line[:-1] + cont_line
 
-    if len(ptr) < 3:
-        print(f"line {textlinenum}: invalid block graphics escape", file=sys.stderr)
-        sys.exit(1)
+        lines.append((textlinenum, line))
 
-    block_str = ptr[1:3]
-    for f, pattern in enumerate(lookup):
-        if block_str == pattern:
-            return 128 + f
+    return lines
 
-    print(f"line {textlinenum}: invalid block graphics escape", file=sys.stderr)
-    sys.exit(1)
+
+def _number_lines(program_lines: List[Tuple[int, bytes]]) -> Iterator[Tuple[int, int, bytes]]:
+    """
+    Work out the line number of each program line, checking it and (in labels
+    mode) registering any label definition in front of it.
+
+    Yields (textlinenum, linenum, text) for each line that is to be
+    tokenized, with text being what follows the line number or label.
+    """
+    linenum = autostart - autoincr if use_labels else -1
+
+    for textlinenum, line in program_lines:
+        lastline = linenum
+
+        if len(line) >= BUF_SIZE - MAX_LABEL_LEN - 1:
+            _die(f"line {textlinenum}: line too big for input buffer")
+
+        # Get line number (or assign one)
+        if use_labels:
+            linenum += autoincr
+            if linenum > 9999:
+                msg = "try using `-s 1 -i 1'" if (autostart > 1 or autoincr > 1) else "too many lines!"
+                _die(f"Generated line number is >9999 - {msg}")
+            linestart_idx = _WS_RE.match(line).end()
+        else:
+            # Like strtol, skip leading spaces; linestart then points AFTER the
+            # number (and any spaces following it)
+            m = _LINENUM_RE.match(line)
+            if m is None:
+                _die(f"line {textlinenum}: missing line number")
+            linenum = int(m.group(1))
+            linestart_idx = m.end()
+
+            if linenum <= lastline:
+                _die(f"line {textlinenum}: line no. not greater than previous one")
+
+        if linenum < 0 or linenum > 9999:
+            _die(f"line {textlinenum}: line no. out of range")
+
+        # Check for line numbers in label mode
+        if use_labels and linestart_idx < len(line) and 48 <= line[linestart_idx] <= 57:
+            _die(f"line {textlinenum}: line number used in labels mode")
+
+        # Handle label definition
+        if use_labels and line.startswith(b'@', linestart_idx):
+            m = _LABEL_DEF_RE.match(line, linestart_idx)
+            if m is None:
+                _die(f"line {textlinenum}: incomplete token definition")
+            label_name = m.group(1)
+            if len(label_name) > MAX_LABEL_LEN:
+                _die(f"line {textlinenum}: token too long")
+            if len(label_to_line) + 1 >= MAX_LABELS:
+                _die(f"line {textlinenum}: too many labels")
+            if label_name in label_to_line:
+                _die(f"line {textlinenum}: attempt to redefine label")
+            label_to_line[label_name] = b'%d' % linenum
+
+            # If now blank, don't insert an actual line
+            linestart_idx = m.end()
+            if linestart_idx >= len(line):
+                linenum -= autoincr
+                continue
+
+        yield textlinenum, linenum, line[linestart_idx:]
+
+
+def _xor_bytes(data: bytes) -> int:
+    """XOR all the bytes of data together (the TAP block checksum)"""
+    # Treat the data as one big integer and fold it in half until a single
+    # byte is left, so the work happens in C a machine word at a time.
+    acc = int.from_bytes(data, 'little')
+    width = len(data)
+    while width > 1:
+        half = (width + 1) // 2
+        acc = (acc >> (8 * half)) ^ (acc & ((1 << (8 * half)) - 1))
+        width = half
+    return acc
 
 
 def usage_help():
@@ -364,8 +588,8 @@ def usage_help():
 def parse_options(argv):
     """Parse command line options - matches C version exactly"""
     global output_format, use_labels, startline, autostart, autoincr
-    global speccy_filename, startlabel, quot_tok_global, quot_tok_list
-    global quot_tok_line_number_count, infile, outfile
+    global speccy_filename, startlabel, quot_tok_global, quot_tok_lines
+    global infile, outfile
 
     startlabel = ""
     infile = "-"
@@ -377,75 +601,61 @@ def parse_options(argv):
         optopt = e.opt if hasattr(e, 'opt') else '?'
         if e.msg == "option requires an argument":
             if optopt in ('a', 'q', 's'):
-                print(f"The `{optopt}' option takes a line number arg.", file=sys.stderr)
+                _die(f"The `{optopt}' option takes a line number arg.")
             elif optopt == 'i':
-                print("The `i' option takes a line incr. arg.", file=sys.stderr)
+                _die("The `i' option takes a line incr. arg.")
             elif optopt == 'n':
-                print("The `n' option takes a Spectrum filename arg.", file=sys.stderr)
+                _die("The `n' option takes a Spectrum filename arg.")
             elif optopt == 'o':
-                print("The `o' option takes a filename arg.", file=sys.stderr)
-            else:
-                print(f"Option `{optopt}' not recognised.", file=sys.stderr)
-        else:
-            print(f"Option `{optopt}' not recognised.", file=sys.stderr)
-        sys.exit(1)
+                _die("The `o' option takes a filename arg.")
+        _die(f"Option `{optopt}' not recognised.")
 
     for opt, arg in opts:
         if opt == '-a':
             if arg.startswith('@'):
                 if len(arg[1:]) > MAX_LABEL_LEN:
-                    print("Auto-start label too long", file=sys.stderr)
-                    sys.exit(1)
+                    _die("Auto-start label too long")
                 startlabel = arg[1:]
             else:
                 if not is_number(arg):
-                    print("Auto-start line must be in the range 0 to 9999.", file=sys.stderr)
-                    sys.exit(1)
+                    _die(_ERR_AUTOSTART)
                 startline = int(arg)
                 if startline > 9999:
-                    print("Auto-start line must be in the range 0 to 9999.", file=sys.stderr)
-                    sys.exit(1)
+                    _die(_ERR_AUTOSTART)
         elif opt == '-h':
             usage_help()
             sys.exit(0)
         elif opt == '-i':
             if not is_number(arg):
-                print("Label line incr. must be in the range 1 to 1000.", file=sys.stderr)
-                sys.exit(1)
+                _die(_ERR_INCR)
             autoincr = int(arg)
             if autoincr < 1 or autoincr > 1000:
-                print("Label line incr. must be in the range 1 to 1000.", file=sys.stderr)
-                sys.exit(1)
+                _die(_ERR_INCR)
         elif opt == '-l':
             use_labels = True
         elif opt == '-n':
             speccy_filename = arg[:10]
         elif opt == '-o':
             if len(arg) > 1023:
-                print("Filename too long", file=sys.stderr)
-                sys.exit(1)
+                _die(_ERR_FILENAME)
             outfile = arg
         elif opt == '-p':
             output_format = OutputFormat.PLUS3DOS
         elif opt == '-q':
             if not is_number(arg) or len(arg) > MAX_LINE_NUMBER_LEN or int(arg) < 0 or int(arg) > 9999:
-                print("Line number must be in the range 0 to 9999.\nSee usage for help\n\t\t% pymakebas -h", file=sys.stderr)
-                sys.exit(1)
+                _die("Line number must be in the range 0 to 9999.\nSee usage for help\n\t\t% pymakebas -h")
             if not quot_tok_global:
                 quot_tok_global = (arg == '0')
             if not quot_tok_global:
-                quot_tok_list.add_no_dupes(arg)
-                quot_tok_line_number_count += 1
+                quot_tok_lines.add(int(arg))
         elif opt == '-r':
             output_format = OutputFormat.RAW
         elif opt == '-s':
             if not is_number(arg):
-                print("Label start line must be in the range 0 to 9999.", file=sys.stderr)
-                sys.exit(1)
+                _die(_ERR_START)
             autostart = int(arg)
             if autostart < 0 or autostart > 9999:
-                print("Label start line must be in the range 0 to 9999.", file=sys.stderr)
-                sys.exit(1)
+                _die(_ERR_START)
 
     if len(args) > 1:
         usage_help()
@@ -453,16 +663,15 @@ def parse_options(argv):
 
     if len(args) == 1:
         if len(args[0]) > 1023:
-            print("Filename too long", file=sys.stderr)
-            sys.exit(1)
+            _die(_ERR_FILENAME)
         infile = args[0]
 
 
 def main():
     """Main program"""
     global output_format, use_labels, startline, autostart, autoincr
-    global speccy_filename, startlabel, labels, label_lines, labelend
-    global quot_tok_global, quot_tok_list, quot_tok_line_number_count
+    global speccy_filename, startlabel, label_to_line
+    global quot_tok_global, quot_tok_lines
     global infile, outfile
 
     # Initialize globals
@@ -474,13 +683,10 @@ def main():
     speccy_filename = ""
     startlabel = ""
 
-    labels = []
-    label_lines = []
-    labelend = 0
+    label_to_line = {}  # label name -> line number, both as bytes
 
     quot_tok_global = False
-    quot_tok_list = QuoteTokList()
-    quot_tok_line_number_count = 0
+    quot_tok_lines = set()  # line numbers to tokenize within quotes (-q)
 
     infile = "-"
     outfile = DEFAULT_OUTPUT
@@ -488,545 +694,267 @@ def main():
     # Parse command line arguments
     parse_options(sys.argv[1:])
 
-    # Open input file
+    # Read the whole input and convert it to bytes in one go; characters
+    # map straight to Spectrum codes (latin-1), as they always have
     if infile == "-":
-        in_file = sys.stdin
+        source = sys.stdin.read()
     else:
         try:
-            in_file = open(infile, 'r')
+            with open(infile, 'r') as in_file:
+                source = in_file.read()
         except IOError:
-            print("Couldn't open input file.", file=sys.stderr)
-            sys.exit(1)
-
-    filebuf = bytearray()
-    linenum = -1
-    passnum = 1
-
-    # Main processing loop
-    while True:
+            _die("Couldn't open input file.")
+    program_lines = _split_lines(source.encode('latin-1'))
+
+    # The program can't exceed FILEBUF_SIZE, so allocate that up front and
+    # fill it in place
+    filebuf = bytearray(FILEBUF_SIZE)
+    filelen = 0
+
+    # Labels can be used before they are defined, so in labels mode all the
+    # lines are numbered (and the labels collected) before tokenizing any
+    numbered_lines = _number_lines(program_lines)
+    if use_labels:
+        numbered_lines = list(numbered_lines)
+
+    for textlinenum, linenum, text in numbered_lines:
+        linestart = bytearray(text)
+
+        # Make token comparison copy (lowercase, blanked-out strings)
+        lcasebuf = linestart.translate(_LOWER_TABLE)
+        tokenize_quotes = quot_tok_global or linenum in quot_tok_lines
+        if not tokenize_quotes:
+            # Blank out everything between quotes (an unclosed string runs
+            # to the end of the line)
+            start = lcasebuf.find(b'"')
+            while start != -1:
+                end = lcasebuf.find(b'"', start + 1)
+                if end == -1:
+                    end = len(lcasebuf)
+                lcasebuf[start + 1:end] = b' ' * (end - start - 1)
+                start = lcasebuf.find(b'"', end + 1)
+
+        # Find REM statement
+        remptr_idx = _find_rem(linestart, lcasebuf)
+
+        # Mark %extension command text so built-in BASIC keyword tokenization
+        # does not rewrite commands like %close into "% CLOSE". Only lines
+        # containing a '%' need scanning.
+        percent_mask = bytearray(len(lcasebuf))
+        if b'%' in lcasebuf:
+            end = len(lcasebuf) if remptr_idx is None else remptr_idx
+            for m in _PERCENT_CMD_RE.finditer(lcasebuf, 0, end):
+                percent_mask[m.start():m.end()] = b'\x01' * (m.end() - m.start())
+
+        # Tokenize keywords
+        _tokenize_keywords(linestart, lcasebuf, remptr_idx, percent_mask)
+
+        # Replace labels with line numbers
         if use_labels:
-            linenum = autostart - autoincr
-        textlinenum = 0
-
-        if passnum > 1:
-            if infile == "-":
-                print("Need seekable input for label support", file=sys.stderr)
-                sys.exit(1)
-            in_file.seek(0)
-
-        while True:
-            line = in_file.readline()
-            if not line:
-                break
-
-            textlinenum += 1
-            lastline = linenum
-
-            # Remove newline
-            if line.endswith('\n'):
-                line = line[:-1]
-
-            # Allow shell-style comments and ignore blank lines
-            if not line or line[0] == '#':
-                continue
+            # Collect the pieces of the rewritten line and join them once
+            pieces = []
+            prev = 0
+            ptr = linestart.find(b'@')
+            while ptr != -1:
+                # Check for escape
+                if ptr > 0 and linestart[ptr - 1] == _BACKSLASH:
+                    ptr = linestart.find(b'@', ptr + 1)
+                    continue
 
-            # Handle line continuation
-            while line.endswith('\\'):
-                cont_line = in_file.readline()
-                if not cont_line:
-                    line = line[:-1]  # remove backslash on EOF
-                    break
-                textlinenum += 1
-                if cont_line.endswith('\n'):
-                    cont_line = cont_line[:-1]
-                line = line[:-1] + cont_line
-
-            if len(line) >= BUF_SIZE - MAX_LABEL_LEN - 1:
-                print(f"line {textlinenum}: line too big for input buffer", file=sys.stderr)
-                sys.exit(1)
-
-            # Get line number (or assign one)
-            if use_labels:
-                linestart_idx = 0
-                linenum += autoincr
-                if linenum > 9999:
-                    msg = "try using `-s 1 -i 1'" if (autostart > 1 or autoincr > 1) else "too many lines!"
-                    print(f"Generated line number is >9999 - {msg}", file=sys.stderr)
-                    sys.exit(1)
-            else:
-                linestart_idx = 0
-                while linestart_idx < len(line) and line[linestart_idx].isspace():
-                    linestart_idx += 1
-                if linestart_idx >= len(line) or not line[linestart_idx].isdigit():
-                    print(f"line {textlinenum}: missing line number", file=sys.stderr)
-                    sys.exit(1)
-
-                # Parse line number - strtol sets linestart to point AFTER the number
-                end_idx = linestart_idx
-                while end_idx < len(line) and line[end_idx].isdigit():
-                    end_idx += 1
-                linenum = int(line[linestart_idx:end_idx])
-                linestart_idx = end_idx  # Point to character after line number
-
-                if linenum <= lastline:
-                    print(f"line {textlinenum}: line no. not greater than previous one", file=sys.stderr)
-                    sys.exit(1)
-
-            if linenum < 0 or linenum > 9999:
-                print(f"line {textlinenum}: line no. out of range", file=sys.stderr)
-                sys.exit(1)
-
-            # Skip remaining spaces after line number
-            while linestart_idx < len(line) and line[linestart_idx].isspace():
-                linestart_idx += 1
-
-            # Check for line numbers in label mode
-            if use_labels and linestart_idx < len(line) and line[linestart_idx].isdigit():
-                print(f"line {textlinenum}: line number used in labels mode", file=sys.stderr)
-                sys.exit(1)
-
-            # Handle label definition
-            if use_labels and linestart_idx < len(line) and line[linestart_idx] == '@':
-                colon_idx = line.find(':', linestart_idx)
-                if colon_idx == -1:
-                    print(f"line {textlinenum}: incomplete token definition", file=sys.stderr)
-                    sys.exit(1)
-                if colon_idx - linestart_idx - 1 > MAX_LABEL_LEN:
-                    print(f"line {textlinenum}: token too long", file=sys.stderr)
-                    sys.exit(1)
-                if passnum == 1:
-                    label_name = line[linestart_idx + 1:colon_idx]
-                    label_lines.append(linenum)
-                    labels.append(label_name)
-                    labelend += 1
-                    if labelend >= MAX_LABELS:
-                        print(f"line {textlinenum}: too many labels", file=sys.stderr)
-                        sys.exit(1)
-                    for f in range(labelend - 1):
-                        if labels[f] == label_name:
-                            print(f"line {textlinenum}: attempt to redefine label", file=sys.stderr)
-                            sys.exit(1)
-
-                    linestart_idx = colon_idx + 1
-                    while linestart_idx < len(line) and line[linestart_idx].isspace():
-                        linestart_idx += 1
-
-                    # If now blank, don't insert an actual line
-                    if linestart_idx >= len(line) or not line[linestart_idx]:
-                        linenum -= autoincr
-                        continue
+                # Try to match label
+                m = _LABEL_REF_RE.match(linestart, ptr + 1)
+                label_line = label_to_line.get(bytes(m.group(0)))
+                if label_line is None:
+                    _die(f"line {textlinenum}: undefined label")
+
+                # Replace label with line number
+                pieces.append(linestart[prev:ptr])
+                pieces.append(label_line)
+                prev = m.end()
+                ptr = linestart.find(b'@', prev)
+
+            if pieces:
+                pieces.append(linestart[prev:])
+                linestart = bytearray().join(pieces)
+
+        # Restore REM token if needed
+        if remptr_idx is not None:
+            linestart[remptr_idx] = REM_TOKEN_NUM
+
+        # Process line and build output
+        outbuf = bytearray()
+        ptr = 0
+        in_rem = False
+        in_deffn = False
+        in_quotes = False
+        in_percent_command = False
+
+        while ptr < len(linestart):
+            if len(outbuf) > OUTBUF_SIZE - 10:
+                _die(f"line {textlinenum}: line too big")
+
+            # Copy runs of bytes that need no special handling in one go.
+            # Inside quotes or a REM only 1s and tabs are dropped; in other
+            # code (outside %commands, which keep their spaces, and BIN
+            # numbers) spaces too.
+            if not in_deffn:
+                if in_quotes or in_rem:
+                    m = _LITERAL_STOP_RE.search(linestart, ptr)
+                    end = m.start() if m else len(linestart)
+                    delete = b'\x01\t'
+                elif not in_percent_command and (ptr == 0 or linestart[ptr - 1] != BIN_TOKEN_NUM):
+                    m = _PLAIN_CODE_RE.match(linestart, ptr)
+                    end = m.end() if m else ptr
+                    delete = b'\x01\t '
                 else:
-                    linestart_idx = colon_idx + 1
-                    while linestart_idx < len(line) and line[linestart_idx].isspace():
-                        linestart_idx += 1
-                    if linestart_idx >= len(line) or not line[linestart_idx]:
-                        linenum -= autoincr
-                        continue
+                    end = ptr
+                if end > ptr:
+                    _emit_run(outbuf, linestart[ptr:end], delete, textlinenum)
+                    ptr = end
+                    continue
 
-            if use_labels and passnum == 1:
-                continue
+            c = linestart[ptr]
 
-            # Extract line content and convert to bytearray
-            linestart_str = line[linestart_idx:]
-            linestart = bytearray(linestart_str.encode('latin-1'))
-
-            # Make token comparison copy (lowercase, blanked-out strings)
-            lcasebuf = bytearray()
-            in_quotes = False
-            for c in linestart:
-                if c == ord('"'):
-                    in_quotes = not in_quotes
-                if in_quotes and c != ord('"') and not (quot_tok_global or (quot_tok_line_number_count and quot_tok_list.search(linenum))):
-                    lcasebuf.append(32)  # space
-                else:
-                    lcasebuf.append(ord(chr(c).lower()))
-
-            # Find REM statement
-            remptr_idx = None
-            rem_str = b"rem"
-            pos = 0
-            while True:
-                pos = lcasebuf.find(rem_str, pos)
-                if pos == -1:
-                    break
-                # Check boundaries
-                prev_is_alpha = pos > 0 and chr(lcasebuf[pos - 1]).isalpha()
-                next_is_alpha = pos + 3 < len(lcasebuf) and chr(lcasebuf[pos + 3]).isalpha()
-                if not prev_is_alpha and not next_is_alpha:
-                    remptr_idx = pos
-                    # Mark REM token and following chars
-                    linestart[pos] = REM_TOKEN_NUM
-                    lcasebuf[pos] = REM_TOKEN_NUM
-                    if pos + 1 < len(linestart):
-                        linestart[pos + 1] = 1
-                        lcasebuf[pos + 1] = 1
-                    if pos + 2 < len(linestart):
-                        linestart[pos + 2] = 1
-                        lcasebuf[pos + 2] = 1
-                    # Absorb trailing space
-                    if pos + 3 < len(linestart) and linestart[pos + 3] == ord(' '):
-                        linestart[pos + 3] = 1
-                        lcasebuf[pos + 3] = 1
-                    break
-                pos += 1
-
-            # Mark %extension command text so built-in BASIC keyword tokenization
-            # does not rewrite commands like %close into "% CLOSE".
-            percent_mask = bytearray(len(lcasebuf))
-            in_percent_command_scan = False
-            for idx, ch in enumerate(lcasebuf):
-                if remptr_idx is not None and idx >= remptr_idx:
-                    break
-                if ch == ord('"'):
-                    in_percent_command_scan = False
-                    continue
-                if ch == ord('%'):
-                    in_percent_command_scan = True
-                    percent_mask[idx] = 1
-                    continue
-                if in_percent_command_scan:
-                    percent_mask[idx] = 1
-                    if ch == ord(':'):
-                        in_percent_command_scan = False
-
-            # Tokenize keywords
-            # C code iterates through flat array: for (tarrptr = tokens; *tarrptr != NULL; tarrptr++)
-            # toknum decrements when alttok is true, BEFORE checking if string is empty
-            toknum = 256
-            alttok = True
-            
-            # Flatten tokens array to match C structure (pairs become flat list)
-            tokens_flat = []
-            for token_pair in tokens:
-                tokens_flat.append(token_pair[0])  # First token
-                tokens_flat.append(token_pair[1] if len(token_pair) > 1 else "")  # Second token (may be empty)
-            
-            for token_str in tokens_flat:
-                if alttok:
-                    toknum -= 1
-                alttok = not alttok
-                
-                # Handle VAL/VAL$ swap
-                if toknum == VAL_TOKEN_NUM:
-                    toknum = VALSTR_TOKEN_NUM
-                elif toknum == VALSTR_TOKEN_NUM:
-                    toknum = VAL_TOKEN_NUM
-
-                # Skip empty strings (but toknum already decremented if alttok was true)
-                if not token_str:
-                    continue
+            if c == _DQUOTE:
+                in_quotes = not in_quotes
 
-                toklen = len(token_str)
-                token_bytes = token_str.lower().encode('latin-1')
-
-                # Find all occurrences
-                # C code: strstr stops at null terminator, so REM prevents tokenization after it
-                pos = 0
-                while True:
-                    # Check if we've reached REM (null terminator)
-                    if remptr_idx is not None and pos >= remptr_idx:
-                        break
-                    pos = lcasebuf.find(token_bytes, pos)
-                    if pos == -1:
-                        break
-                    # Stop if we've reached REM
-                    if remptr_idx is not None and pos >= remptr_idx:
-                        break
-                    if percent_mask[pos]:
-                        pos += toklen
-                        continue
+            # Preserve spacing inside %extension commands; elsewhere match the
+            # original behavior of collapsing spaces outside quotes/REM.
+            if c == 1 or c == 9 or (not in_quotes and not in_rem and not in_percent_command and c == _SPACE):
+                ptr += 1
+                continue
 
-                    # Check it's not in the middle of a word (except for <>, <=, >=)
-                    # C code: (*tarrptr)[0] == '<' || (*tarrptr)[1] == '=' || (!isalpha(ptr[-1]) && !isalpha(ptr[toklen]))
-                    # In C, isalpha() returns 0 for values >= 128, so we need to check < 128 first
-                    prev_is_alpha = False
-                    if pos > 0 and lcasebuf[pos - 1] < 128:
-                        prev_is_alpha = chr(lcasebuf[pos - 1]).isalpha()
-                    next_is_alpha = False
-                    if pos + toklen < len(lcasebuf) and lcasebuf[pos + toklen] < 128:
-                        next_is_alpha = chr(lcasebuf[pos + toklen]).isalpha()
-
-                    if token_str[0] == '<' or (len(token_str) > 1 and token_str[1] == '=') or (not prev_is_alpha and not next_is_alpha):
-                        # Replace token
-                        linestart[pos] = toknum
-                        lcasebuf[pos] = toknum
-                        for f in range(1, toklen):
-                            if pos + f < len(linestart):
-                                linestart[pos + f] = 1
-                                lcasebuf[pos + f] = 1
-
-                        # Absorb trailing spaces
-                        f = toklen
-                        while pos + f < len(linestart) and linestart[pos + f] == ord(' '):
-                            linestart[pos + f] = 1
-                            lcasebuf[pos + f] = 1
-                            f += 1
-
-                        # Special handling for BIN token
-                        if toknum == BIN_TOKEN_NUM:
-                            linestart[pos] = 1
-                            lcasebuf[pos] = 1
-                            if pos + f - 1 < len(linestart):
-                                linestart[pos + f - 1] = toknum
-                                lcasebuf[pos + f - 1] = toknum
-
-                    pos += toklen
-
-            # Replace labels with line numbers
-            if use_labels:
-                ptr = 0
-                while True:
-                    ptr = linestart.find(ord('@'), ptr)
-                    if ptr == -1:
-                        break
-
-                    # Check for escape
-                    if ptr > 0 and linestart[ptr - 1] == ord('\\'):
+            if c == DEFFN_TOKEN_NUM:
+                in_deffn = True
+
+            if c == REM_TOKEN_NUM:
+                in_rem = True
+
+            if not in_quotes and not in_rem:
+                if c == _PERCENT:
+                    in_percent_command = True
+                elif c == _COLON:
+                    in_percent_command = False
+
+            # Handle escape sequences
+            if c == _BACKSLASH and ptr + 1 < len(linestart):
+                esc = linestart[ptr + 1]
+                udg = _ESC_UDG[esc]
+                if udg:
+                    outbuf.append(udg)
+                elif esc in _ESC_SPECIAL:
+                    outbuf.append(_ESC_SPECIAL[esc])
+                elif esc in b"'.: ":
+                    # Block graphics
+                    if ptr + 3 <= len(linestart):
+                        block_str = linestart[ptr:ptr + 3].decode('latin-1')
+                        block_val = grok_block(block_str, textlinenum)
+                        outbuf.append(block_val)
                         ptr += 1
-                        continue
-
-                    # Try to match label
-                    ptr += 1
-                    matched = False
-                    for f in range(labelend):
-                        label = labels[f]
-                        len_label = len(label)
-                        label_bytes = label.encode('latin-1')
-                        if linestart[ptr:ptr + len_label] == label_bytes:
-                            next_char = linestart[ptr + len_label] if ptr + len_label < len(linestart) else 0
-                            if next_char < 33 or next_char > 126 or next_char == ord(':'):
-                                # Replace label with line number
-                                numbuf = str(label_lines[f]).encode('latin-1')
-                                # Remove label text
-                                new_linestart = linestart[:ptr - 1] + numbuf + linestart[ptr + len_label:]
-                                linestart = new_linestart
-                                ptr += len(numbuf)
-                                matched = True
-                                break
-
-                    if not matched:
-                        print(f"line {textlinenum}: undefined label", file=sys.stderr)
-                        sys.exit(1)
-
-            # Restore REM token if needed
-            if remptr_idx is not None:
-                linestart[remptr_idx] = REM_TOKEN_NUM
-
-            # Process line and build output
-            outbuf = bytearray()
-            ptr = 0
-            in_rem = False
-            in_deffn = False
-            in_quotes = False
-            in_percent_command = False
-
-            while ptr < len(linestart):
-                if len(outbuf) > OUTBUF_SIZE - 10:
-                    print(f"line {textlinenum}: line too big", file=sys.stderr)
-                    sys.exit(1)
-
-                c = linestart[ptr]
-
-                if c == ord('"'):
-                    in_quotes = not in_quotes
-
-                # Preserve spacing inside %extension commands; elsewhere match the
-                # original behavior of collapsing spaces outside quotes/REM.
-                if c == 1 or c == 9 or (not in_quotes and not in_rem and not in_percent_command and c == ord(' ')):
-                    ptr += 1
-                    continue
+                    else:
+                        _die(f"line {textlinenum}: invalid block graphics escape")
+                elif esc == _LBRACE:
+                    # Direct character code
+                    end_brace = linestart.find(_RBRACE, ptr + 2)
+                    if end_brace == -1:
+                        _die(f"line {textlinenum}: unclosed brace in eight-bit character code")
+                    try:
+                        # Supports decimal, octal, hex; int() takes the bytes as-is
+                        num_ascii = int(linestart[ptr + 2:end_brace], 0)
+                    except ValueError:
+                        _die(f"line {textlinenum}: invalid character code")
+                    if num_ascii < 0 or num_ascii > 255:
+                        _die(f"line {textlinenum}: eight-bit character code out of range")
+                    outbuf.append(num_ascii)
+                    ptr = end_brace - 1
+                else:
+                    print(f"line {textlinenum}: warning: unknown escape `{chr(esc)}', inserting literally", file=sys.stderr)
+                    outbuf.append(esc)
+                ptr += 2
+                continue
 
-                if c == DEFFN_TOKEN_NUM:
-                    in_deffn = True
+            # Handle numbers
+            if not in_rem and not in_quotes:
+                prev_char = linestart[ptr - 1] if ptr > 0 else _SPACE
 
-                if c == REM_TOKEN_NUM:
-                    in_rem = True
+                if prev_char == BIN_TOKEN_NUM:
+                    # Number after BIN token
+                    num_val, ptr2 = grok_binary(linestart, ptr, textlinenum)
+                    num = float(num_val)
 
-                if not in_quotes and not in_rem:
-                    if c == ord('%'):
-                        in_percent_command = True
-                    elif c == ord(':'):
-                        in_percent_command = False
+                    # Output number text
+                    outbuf.extend(linestart[ptr:ptr2])
 
-                # Handle escape sequences
-                if c == ord('\\') and ptr + 1 < len(linestart):
-                    esc_char = chr(linestart[ptr + 1])
-                    if esc_char.isalpha() and esc_char.lower() not in "vwxyz":
-                        outbuf.append(144 + ord(esc_char.lower()) - ord('a'))
-                    else:
-                        if esc_char == '\\':
-                            outbuf.append(ord('\\'))
-                        elif esc_char == '@':
-                            outbuf.append(ord('@'))
-                        elif esc_char == '*':
-                            outbuf.append(127)  # copyright symbol
-                        elif esc_char in ("'", '.', ':', ' '):
-                            # Block graphics
-                            if ptr + 3 <= len(linestart):
-                                block_str = ''.join(chr(b) for b in linestart[ptr:ptr + 3])
-                                block_val = grok_block(block_str, textlinenum)
-                                outbuf.append(block_val)
-                                ptr += 1
-                            else:
-                                print(f"line {textlinenum}: invalid block graphics escape", file=sys.stderr)
-                                sys.exit(1)
-                        elif esc_char == '{':
-                            # Direct character code
-                            end_brace = linestart.find(ord('}'), ptr + 2)
-                            if end_brace == -1:
-                                print(f"line {textlinenum}: unclosed brace in eight-bit character code", file=sys.stderr)
-                                sys.exit(1)
-                            code_str = linestart[ptr + 2:end_brace].decode('latin-1', errors='ignore')
-                            try:
-                                num_ascii = int(code_str, 0)  # Supports decimal, octal, hex
-                            except ValueError:
-                                print(f"line {textlinenum}: invalid character code", file=sys.stderr)
-                                sys.exit(1)
-                            if num_ascii < 0 or num_ascii > 255:
-                                print(f"line {textlinenum}: eight-bit character code out of range", file=sys.stderr)
-                                sys.exit(1)
-                            outbuf.append(num_ascii)
-                            ptr = end_brace - 1
-                        else:
-                            print(f"line {textlinenum}: warning: unknown escape `{esc_char}', inserting literally", file=sys.stderr)
-                            outbuf.append(linestart[ptr + 1])
-                    ptr += 2
+                    # Output inline FP representation
+                    outbuf += _inline_number(num, textlinenum)
+                    ptr = ptr2
                     continue
 
-                # Handle numbers
-                if not in_rem and not in_quotes:
-                    prev_char = linestart[ptr - 1] if ptr > 0 else ord(' ')
-                    prev_is_alpha = chr(prev_char).isalpha() if prev_char < 128 else False
-
-                    # Check if this looks like the start of a number
-                    is_num_start = False
-                    if chr(c).isdigit():
-                        is_num_start = True
-                    elif ptr + 1 < len(linestart):
-                        next_char = linestart[ptr + 1]
-                        if c == ord('.') and chr(next_char).isdigit():
-                            is_num_start = True
-                        elif c in (ord('-'), ord('+')) and (chr(next_char).isdigit() or
-                                                            (chr(next_char) == '.' and ptr + 2 < len(linestart) and chr(linestart[ptr + 2]).isdigit())):
-                            is_num_start = True
-
-                    if is_num_start and not prev_is_alpha and prev_char != BIN_TOKEN_NUM:
-                        # Parse number using strtod equivalent
-                        # Convert bytearray slice to string for parsing
-                        remaining_str = linestart[ptr:].decode('latin-1', errors='ignore')
-                        try:
-                            # Use a regex or manual parsing to find where the number ends
-                            # strtod() stops at the first character that cannot be part of a number
-                            import re
-                            # Match a number: optional sign, digits, optional decimal point and more digits, optional exponent
-                            match = re.match(r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?', remaining_str)
-                            if match:
-                                num_str = match.group(0)
-                                num = float(num_str)
-                                num_end = len(num_str)
-                                ptr2 = ptr + num_end
-
-                                # Output number text (original bytes)
-                                outbuf.extend(linestart[ptr:ptr2])
-
-                                # Output inline FP representation
-                                outbuf.append(0x0e)
-                                success, num_exp, num_mantissa = dbl2spec(num)
-                                if not success:
-                                    print(f"line {textlinenum}: exponent out of range (number too big)", file=sys.stderr)
-                                    sys.exit(1)
-                                outbuf.append(num_exp)
-                                outbuf.append((num_mantissa >> 24) & 0xFF)
-                                outbuf.append((num_mantissa >> 16) & 0xFF)
-                                outbuf.append((num_mantissa >> 8) & 0xFF)
-                                outbuf.append(num_mantissa & 0xFF)
-                                ptr = ptr2
-                                continue
-                        except (ValueError, IndexError, AttributeError):
-                            # Not a valid number, fall through to normal character handling
-                            pass
-                    elif prev_char == BIN_TOKEN_NUM:
-                        # Number after BIN token
-                        num_str_bytes = linestart[ptr:].decode('latin-1', errors='ignore')
-                        num_val, ptr2_str = grok_binary(num_str_bytes, textlinenum)
-                        num = float(num_val)
-                        ptr2 = ptr + (len(num_str_bytes) - len(ptr2_str))
-
-                        # Output number text
+                # A number can only start with a digit, '.', '+' or '-' (the
+                # regex checks what follows) and not in the middle of a word
+                if _IS_NUM_START[c] and not _IS_ALPHA[prev_char]:
+                    # Parse number using strtod equivalent: strtod() stops at
+                    # the first character that cannot be part of a number
+                    m = _NUM_RE.match(linestart, ptr)
+                    if m:
+                        ptr2 = m.end()
+                        num = float(linestart[ptr:ptr2])
+
+                        # Output number text (original bytes)
                         outbuf.extend(linestart[ptr:ptr2])
 
                         # Output inline FP representation
-                        outbuf.append(0x0e)
-                        success, num_exp, num_mantissa = dbl2spec(num)
-                        if not success:
-                            print(f"line {textlinenum}: exponent out of range (number too big)", file=sys.stderr)
-                            sys.exit(1)
-                        outbuf.append(num_exp)
-                        outbuf.append((num_mantissa >> 24) & 0xFF)
-                        outbuf.append((num_mantissa >> 16) & 0xFF)
-                        outbuf.append((num_mantissa >> 8) & 0xFF)
-                        outbuf.append(num_mantissa & 0xFF)
+                        outbuf += _inline_number(num, textlinenum)
                         ptr = ptr2
                         continue
 
-                # Special DEF FN case
-                if in_deffn:
-                    if c == ord('='):
-                        in_deffn = False
-                    else:
-                        if c in (ord(','), ord(')')):
-                            outbuf.append(0x0e)
-                            outbuf.extend([0, 0, 0, 0, 0])
-                            outbuf.append(c)
-                            ptr += 1
-                            continue
-
-                        if c != ord(' '):
-                            if c == ord('='):
-                                in_deffn = False
-                            outbuf.append(c)
-                            ptr += 1
-                            continue
+            # Special DEF FN case
+            if in_deffn:
+                if c == _EQUALS:
+                    in_deffn = False
                 else:
-                    # Normal character output
-                    outbuf.append(c)
-                    ptr += 1
+                    if c in (_COMMA, _RPAREN):
+                        outbuf += _DEFFN_PLACEHOLDER
+                        outbuf.append(c)
+                        ptr += 1
+                        continue
 
-            # Add terminating CR
-            outbuf.append(0x0d)
+                    if c != _SPACE:
+                        if c == _EQUALS:
+                            in_deffn = False
+                        outbuf.append(c)
+                        ptr += 1
+                        continue
+            else:
+                # Normal character output
+                outbuf.append(c)
+                ptr += 1
 
-            # Check buffer size
-            linelen = len(outbuf)
-            if len(filebuf) + 4 + linelen > FILEBUF_SIZE:
-                print("program too big!", file=sys.stderr)
-                sys.exit(1)
+        # Add terminating CR
+        outbuf.append(0x0d)
 
-            # Write line to filebuf
-            filebuf.extend(struct.pack('>H', linenum))  # line number (big-endian)
-            filebuf.extend(struct.pack('<H', linelen))  # line length (little-endian)
-            filebuf.extend(outbuf)
+        # Check buffer size
+        linelen = len(outbuf)
+        if filelen + 4 + linelen > FILEBUF_SIZE:
+            _die("program too big!")
 
-        passnum += 1
-        if not (use_labels and passnum <= 2):
-            break
+        # Write line to filebuf
+        struct.pack_into('>H', filebuf, filelen, linenum)  # line number (big-endian)
+        struct.pack_into('<H', filebuf, filelen + 2, linelen)  # line length (little-endian)
+        filebuf[filelen + 4:filelen + 4 + linelen] = outbuf
+        filelen += 4 + linelen
 
-    if in_file != sys.stdin:
-        in_file.close()
+    # Trim the unused end of the buffer
+    del filebuf[filelen:]
 
     # Check auto-start label
     if startlabel:
         if not use_labels:
-            print("Auto-start label specified, but not using labels!", file=sys.stderr)
-            sys.exit(1)
-        found = False
-        for f in range(labelend):
-            if labels[f] == startlabel:
-                startline = label_lines[f]
-                found = True
-                break
-        if not found:
-            print("Auto-start label is undefined", file=sys.stderr)
-            sys.exit(1)
+            _die("Auto-start label specified, but not using labels!")
+        label_line = label_to_line.get(startlabel.encode('latin-1'))
+        if label_line is None:
+            _die("Auto-start label is undefined")
+        startline = int(label_line)
 
     # Write output file
     if outfile == "-":
@@ -1035,11 +963,14 @@ def main():
         try:
             out_file = open(outfile, 'wb')
         except IOError:
-            print("Couldn't open output file.", file=sys.stderr)
-            sys.exit(1)
+            _die("Couldn't open output file.")
 
     siz = len(filebuf)
 
+    # Assemble the file as a list of pieces and hand it to the (buffered)
+    # writer in one call; the program itself goes in as a view, not a copy
+    output = []
+
     if output_format == OutputFormat.PLUS3DOS:
         # Make header
         headerbuf = bytearray(128)
@@ -1057,9 +988,10 @@ def main():
         headerbuf[20] = siz & 0xFF
         headerbuf[21] = (siz >> 8) & 0xFF
 
-        chk = sum(headerbuf[:127]) & 0xFF
-        out_file.write(headerbuf[:127])
-        out_file.write(bytes([chk]))
+        # The last header byte is the checksum of the others
+        headerbuf[127] = sum(memoryview(headerbuf)[:127]) & 0xFF
+        output.append(headerbuf)
+        output.append(memoryview(filebuf))
 
     elif output_format == OutputFormat.TAP:
         # Make header
@@ -1077,35 +1009,26 @@ def main():
         headerbuf[15] = siz & 0xFF
         headerbuf[16] = (siz >> 8) & 0xFF
 
-        # Write header
-        chk = 0
-        out_file.write(bytes([19, 0, chk]))
-        for f in range(17):
-            chk ^= headerbuf[f]
-        out_file.write(headerbuf)
-        out_file.write(bytes([chk]))
+        # Header block: length 19, flag byte 0, header, checksum
+        output.append(bytes([19, 0, 0]))
+        output.append(headerbuf)
+        output.append(bytes([_xor_bytes(headerbuf)]))
 
-        # Write tap bit for data block
+        # Data block: length, flag byte 255, program, checksum
         # C code: fprintf(out, "%c%c%c", (siz + 2) & 255, (siz + 2) >> 8, chk = 255);
-        # This writes: low_byte, high_byte, 255 (initial checksum)
         # Then calculates: for (f = 0; f < siz; f++) chk ^= filebuf[f];
-        chk = 255
-        out_file.write(struct.pack('<H', siz + 2))
-        out_file.write(bytes([chk]))  # Write initial checksum (255)
-        # Now calculate checksum by XORing with filebuf
-        for f in range(siz):
-            chk ^= filebuf[f]
+        output.append(struct.pack('<HB', siz + 2, 255))
+        output.append(memoryview(filebuf))
+        output.append(bytes([255 ^ _xor_bytes(filebuf)]))
 
-    # Write file data
-    out_file.write(filebuf)
+    else:
+        output.append(memoryview(filebuf))
 
-    if output_format == OutputFormat.TAP:
-        out_file.write(bytes([chk]))
+    out_file.writelines(output)
 
     if out_file != sys.stdout.buffer:
         out_file.close()
 
-    quot_tok_list.free()
     sys.exit(0)
 
 
@@ -22,10 +22,12 @@ except ImportError:
     else:
         venv_python_path = os.path.join(sdk_dir, "venv", "bin", "python3")
     
-    if os.path.exists(venv_python_path):
+    # The sentinel stops a venv without pyserial from re-executing itself forever
+    if os.path.exists(venv_python_path) and not os.environ.get("SPECTRANEXT_VENV_REEXEC"):
         # Re-execute with venv Python
         import subprocess
-        sys.exit(subprocess.call([venv_python_path] + sys.argv))
+        env = dict(os.environ, SPECTRANEXT_VENV_REEXEC="1")
+        sys.exit(subprocess.call([venv_python_path] + sys.argv, env=env))
     else:
         # No venv found - give helpful error
         print("Error: pyserial module not found.", file=sys.stderr)
@@ -41,19 +43,112 @@ import serial.tools.list_ports
 VENDOR_ID = 0x1337
 PRODUCT_ID = 0x0001
 
+# Where the last detected port and serial number are remembered
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "spectranext", "port")
 
-def find_spectranext_device():
+
+def _sysfs_confirms_device(port, serial_number):
+    """
+    Check a previously found port against Linux sysfs, without enumerating ports.
+    
+    Returns:
+        True if the tty still belongs to the Spectranext with this serial number,
+        False if it belongs to another USB device, None if sysfs can't tell
+        (not Linux, node gone, or attributes unreadable)
+    """
+    # On Linux the tty's USB interface sits under the device with the IDs
+    usb_dir = os.path.join("/sys/class/tty", os.path.basename(port), "device", "..")
+    try:
+        with open(os.path.join(usb_dir, "idVendor")) as f:
+            vid = int(f.read(), 16)
+        with open(os.path.join(usb_dir, "idProduct")) as f:
+            pid = int(f.read(), 16)
+        with open(os.path.join(usb_dir, "serial")) as f:
+            found_serial = f.read().strip()
+    except (OSError, ValueError):
+        return None
+    
+    return vid == VENDOR_ID and pid == PRODUCT_ID and found_serial == serial_number
+
+
+def _is_spectranext(port_info):
+    """True if a list_ports entry has the Spectranext VID/PID"""
+    return port_info.vid == VENDOR_ID and port_info.pid == PRODUCT_ID
+
+
+def _known_device():
+    """
+    Where the device was last seen, unverified.
+    
+    SPECTRANEXT_CLI/SPECTRANEXT_SERIAL from the environment (as printed by
+    this script) take precedence over the cache file.
+    
+    Returns:
+        Tuple of (port device path, serial number) or (None, None) if unknown
+    """
+    port = os.environ.get("SPECTRANEXT_CLI")
+    serial_number = os.environ.get("SPECTRANEXT_SERIAL")
+    if not port:
+        try:
+            with open(CACHE_FILE) as f:
+                port, serial_number = (f.read().split("\n") + ["", ""])[:2]
+        except OSError:
+            return None, None
+    
+    if port and serial_number:
+        return port, serial_number
+    
+    return None, None
+
+
+def _remember_device(port, serial_number):
+    """Save the found device to the cache file; failures are not fatal"""
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        with open(CACHE_FILE, "w") as f:
+            f.write(f"{port}\n{serial_number}\n")
+    except OSError:
+        pass
+
+
+def find_spectranext_device(use_cache=True):
     """
     Find the Spectranext USB CDC device (single unified interface).
     
+    The last known port is tried first. On Linux it is confirmed through sysfs
+    without enumerating ports; elsewhere one port enumeration confirms its
+    VID/PID and serial number, and the same listing is then searched if the
+    device has moved.
+    
+    Args:
+        use_cache: Try the last known port first (default: True). Pass False to
+                   always enumerate, e.g. to find a new path after a USB reset.
+    
     Returns:
         Tuple of (port device path, serial number) or (None, None) if not found
     """
-    ports = serial.tools.list_ports.comports()
+    ports = None
+    if use_cache:
+        known_port, known_serial = _known_device()
+        if known_port is not None:
+            confirmed = _sysfs_confirms_device(known_port, known_serial)
+            if confirmed is None:
+                ports = serial.tools.list_ports.comports()
+                confirmed = any(
+                    p.device == known_port and _is_spectranext(p) and p.serial_number == known_serial
+                    for p in ports
+                )
+            if confirmed:
+                return known_port, known_serial
+    
+    if ports is None:
+        ports = serial.tools.list_ports.comports()
     
     # Find first spectranext device
     for port in ports:
-        if port.vid == VENDOR_ID and port.pid == PRODUCT_ID:
+        if _is_spectranext(port):
+            if port.serial_number:
+                _remember_device(port.device, port.serial_number)
             return port.device, port.serial_number
     
     return None, None
@@ -11,17 +11,52 @@ import socket
 import argparse
 import time
 import binascii
+import collections
+import contextlib
 import threading
 import queue
 import signal
 import errno
-from typing import Optional, Tuple, List
+import functools
+import re
+import select
+import shlex
+import zlib
+from typing import BinaryIO, Iterator, Optional, Tuple, List, Union
 
 # RP2350 CLI: hidden exec result markers in terminal stream (O-packets). Strip from output;
 # map to process exit code when seen (spx exec).
 EXEC_RESULT_SUCCESS = b"\x1e\x06\x1f"
 EXEC_RESULT_FAILURE = b"\x1e\x15\x1f"
 
+# Number of vFile:pread / vFile:pwrite requests kept in flight while downloading / uploading
+PREAD_PIPELINE_DEPTH = 4
+PWRITE_PIPELINE_DEPTH = 4
+
+# Number of vFile:unlink requests kept in flight when deleting several files
+UNLINK_PIPELINE_DEPTH = 8
+
+# Number of vSpectranext:readdir requests kept in flight while listing a directory
+READDIR_PIPELINE_DEPTH = 4
+
+# First byte of anything meaningful on the wire: ACK, NAK or packet start
+_RSP_FRAME_START_RE = re.compile(rb'[-+$]')
+
+# Packet trailer ("#xx") for every checksum value
+_RSP_CHECKSUM_SUFFIX = tuple(b"#%02x" % i for i in range(256))
+
+# Incoming "xx" checksum digits (any case) -> value
+_RSP_CHECKSUM_VALUE = {
+    bytes((hi, lo)): int(bytes((hi, lo)), 16)
+    for hi in b"0123456789abcdefABCDEF"
+    for lo in b"0123456789abcdefABCDEF"
+}
+
+# RSP binary escaping: '}' followed by the original byte XOR 0x20
+_RSP_ESCAPE_RE = re.compile(rb'[}#$*]')
+_RSP_ESCAPES = {bytes((b,)): bytes((0x7d, b ^ 0x20)) for b in b'}#$*'}
+_RSP_UNESCAPE_RE = re.compile(rb'}(?:.|\Z)', re.DOTALL)
+
 # fcntl is Unix-only, not available on Windows
 try:
     import fcntl
@@ -36,15 +71,25 @@ try:
 except ImportError:
     HAS_MSVCRT = False
 
-# Import device detection from spectranext-detect.py
-import importlib.util
-_detect_path = os.path.join(os.path.dirname(__file__), 'spectranext-detect.py')
-_spec = importlib.util.spec_from_file_location('spectranext_detect', _detect_path)
-_spectranext_detect = importlib.util.module_from_spec(_spec)
-_spec.loader.exec_module(_spectranext_detect)
-find_spectranext_device = _spectranext_detect.find_spectranext_device
-VENDOR_ID = _spectranext_detect.VENDOR_ID
-PRODUCT_ID = _spectranext_detect.PRODUCT_ID
+# Device detection lives in spectranext-detect.py. It is loaded on first use, as it
+# pulls in serial.tools.list_ports, which TCP connections and explicit ports never need.
+@functools.lru_cache(maxsize=None)
+def _spectranext_detect():
+    """Load and return the spectranext-detect.py module"""
+    import importlib.util
+    detect_path = os.path.join(os.path.dirname(__file__), 'spectranext-detect.py')
+    spec = importlib.util.spec_from_file_location('spectranext_detect', detect_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def find_spectranext_device(use_cache: bool = True):
+    """
+    Find the Spectranext USB CDC device; returns (port, serial number) or (None, None).
+    use_cache=False skips the last known port and always enumerates.
+    """
+    return _spectranext_detect().find_spectranext_device(use_cache=use_cache)
 
 
 def _is_usb_busy_error(exc: BaseException) -> bool:
@@ -89,7 +134,8 @@ def _linux_usb_device_sysfs_from_tty(tty_path: str) -> Optional[str]:
                     pid = int(f.read().strip(), 16)
             except (OSError, ValueError):
                 return None
-            if vid == VENDOR_ID and pid == PRODUCT_ID:
+            detect = _spectranext_detect()
+            if vid == detect.VENDOR_ID and pid == detect.PRODUCT_ID:
                 return cur
             return None
         parent = os.path.dirname(cur)
@@ -124,6 +170,8 @@ def _try_reset_spectranext_usb(port_path: str, verbose: bool = False) -> bool:
     Reset the Spectranext USB device so another holder (e.g. browser Web Serial) releases the port.
     Tries PyUSB first, then Linux sysfs authorized toggle.
     """
+    detect = _spectranext_detect()
+    
     # 1) PyUSB (works on Linux/macOS/Windows with appropriate backend)
     try:
         import usb.core
@@ -136,12 +184,12 @@ def _try_reset_spectranext_usb(port_path: str, verbose: bool = False) -> bool:
             try:
                 import serial.tools.list_ports
                 for p in serial.tools.list_ports.comports():
-                    if p.device == port_path and p.vid == VENDOR_ID and p.pid == PRODUCT_ID:
+                    if p.device == port_path and p.vid == detect.VENDOR_ID and p.pid == detect.PRODUCT_ID:
                         serial_num = getattr(p, "serial_number", None)
                         break
             except Exception:
                 pass
-            devs = list(usb.core.find(find_all=True, idVendor=VENDOR_ID, idProduct=PRODUCT_ID))
+            devs = list(usb.core.find(find_all=True, idVendor=detect.VENDOR_ID, idProduct=detect.PRODUCT_ID))
             if not devs:
                 if verbose:
                     print("[USB] No USB device with Spectranext VID/PID found for reset", file=sys.stderr)
@@ -198,7 +246,8 @@ def _rediscover_spectranext_port(old_port: str, verbose: bool) -> Optional[str]:
     """
     deadline = time.monotonic() + 20.0
     while time.monotonic() < deadline:
-        new_port, _ = find_spectranext_device()
+        # Bypass the last known port: the old node may linger while the device re-enumerates
+        new_port, _ = find_spectranext_device(use_cache=False)
         if new_port:
             np = _prefer_cu_serial_port(new_port)
             if verbose and np != old_port:
@@ -234,6 +283,11 @@ def _open_device_path_with_busy_retry(path: str, timeout_s: float = 12.0, verbos
     raise OSError(errno.EBUSY, os.strerror(errno.EBUSY), path)
 
 
+def _remote_join(remote_dir: str, name: str) -> str:
+    """Join a device path and an entry name"""
+    return remote_dir.rstrip('/') + '/' + name
+
+
 # Exception classes
 class RSPException(Exception):
     """Base exception for RSP errors"""
@@ -270,9 +324,25 @@ class RSPInvalidError(RSPException):
     pass
 
 
+# Device errno -> (exception class, default message); anything else is RSPIOError
+_ERRNO_EXCEPTIONS = {
+    2: (RSPNotFoundError, "File or directory not found"),  # ENOENT
+    5: (RSPIOError, "I/O error"),  # EIO
+    13: (RSPPermissionError, "Permission denied"),  # EACCES
+    17: (RSPExistsError, "Already exists"),  # EEXIST
+    22: (RSPInvalidError, "Invalid parameter"),  # EINVAL
+}
+
+
 class SPXConnection:
     """Connection to SPX device using RSP protocol"""
     
+    # Fixed packets, pre-encoded so _send_packet can frame them directly
+    _PKT_READDIR = b"vSpectranext:readdir"
+    _PKT_CLOSEDIR = b"vSpectranext:closedir"
+    _PKT_REBOOT = b"vSpectranext:reboot"
+    _PKT_AUTOBOOT = b"vSpectranext:autoboot"
+    
     def __init__(self, port: Optional[str] = None, show_progress: bool = True, verbose: bool = False):
         """
         Initialize connection to SPX device.
@@ -292,6 +362,7 @@ class SPXConnection:
         
         # Set flags before any operations that might use them
         self.show_progress = show_progress and sys.stdout.isatty()
+        self._last_progress_time = 0.0
         self.verbose = verbose
         
         # Determine connection type
@@ -355,11 +426,18 @@ class SPXConnection:
         self.max_packet_size = 1024
         
         # Queue for storing response packets (non-O packets) and ACK/NAK
-        self._response_queue = queue.Queue()
+        self._response_queue = queue.SimpleQueue()
+        
+        # ACK/NAK bytes go to their own queue so responses to pipelined requests never
+        # have to be stepped over while waiting for an ACK (and vice versa)
+        self._ack_queue = queue.SimpleQueue()
         
         # O-packet callback for streaming output
         self._o_packet_callback = None
         
+        # Bytes received but not yet parsed into packets (reader thread only)
+        self._rx_buffer = bytearray()
+        
         # Thread control
         self._reader_thread = None
         self._reader_stop = threading.Event()
@@ -391,9 +469,14 @@ class SPXConnection:
                 raise RSPException(f"Invalid TCP address: {self.port}")
         
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+            # Larger buffers must be set before connect to affect the negotiated window
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
             self.sock.settimeout(1)  # 1 second timeout for connect
             self.sock.connect((host, port))
+            # RSP is small request/ACK/response packets; don't let Nagle hold them back
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.sock.settimeout(1)  # 1 second timeout for read/write
             if self.verbose:
                 print(f"[TCP] Connected to {host}:{port}", file=sys.stderr)
@@ -547,7 +630,24 @@ class SPXConnection:
                 self._connect_usb(_reset_attempted=True)
                 return
             raise RSPException(f"Failed to open serial port {self.port}: {e}")
-        
+
+        # Linux: ask the tty driver for low-latency mode to cut per-packet turnaround.
+        # Only some drivers support it (ioctl fails with ENOTTY etc.), so this is best-effort.
+        try:
+            self.ser.set_low_latency_mode(True)
+            if self.verbose:
+                print(f"[USB] Low-latency mode enabled on {self.port}", file=sys.stderr)
+        except (AttributeError, NotImplementedError, ValueError, OSError):
+            pass
+
+        # Windows: the driver's default 4 KiB queues are smaller than a few pipelined
+        # vFile replies; enlarge them (set_buffer_size only exists on Windows)
+        if hasattr(self.ser, 'set_buffer_size'):
+            try:
+                self.ser.set_buffer_size(rx_size=1 << 20, tx_size=1 << 20)
+            except (ValueError, OSError, serial.SerialException):
+                pass
+
         # Give device time to stabilize
         time.sleep(0.1)
         
@@ -574,8 +674,9 @@ class SPXConnection:
             except socket.error as e:
                 raise RSPIOError(f"TCP write error: {e}")
         else:
+            # No flush here: tcdrain() per packet costs a kernel round trip, and the
+            # ACK/response we wait for next already orders the exchange
             self.ser.write(data)
-            self.ser.flush()
     
     def _flush(self) -> None:
         """Flush output buffer (USB only, TCP doesn't need flushing)"""
@@ -583,36 +684,23 @@ class SPXConnection:
             self.ser.flush()
     
     def _drain_input(self):
-        """Drain any leftover data from input buffer"""
+        """Drain any leftover data from input buffer (without waiting for more to arrive)"""
         if self.is_tcp:
-            # For TCP, set a short timeout and read until nothing comes
-            old_timeout = self.sock.gettimeout()
-            self.sock.settimeout(0.1)
-            try:
-                while True:
-                    try:
-                        data = self.sock.recv(4096)
-                        if len(data) == 0:
-                            break
-                    except socket.timeout:
-                        break
-            finally:
-                self.sock.settimeout(old_timeout)
+            # For TCP, read only while select reports data already queued
+            while select.select([self.sock], [], [], 0)[0]:
+                data = self.sock.recv(4096)
+                if len(data) == 0:
+                    break
         else:
-            old_timeout = self.ser.timeout
-            self.ser.timeout = 0.1
             try:
                 while True:
-                    try:
-                        data = self.ser.read(4096)
-                        if len(data) == 0:
-                            break
-                    except serial.serialutil.SerialException as e:
-                        if "device reports readiness to read but returned no data" in str(e):
-                            break
-                        raise
-            finally:
-                self.ser.timeout = old_timeout
+                    waiting = self.ser.in_waiting
+                    if not waiting:
+                        break
+                    self.ser.read(waiting)
+            except serial.serialutil.SerialException as e:
+                if "device reports readiness to read but returned no data" not in str(e):
+                    raise
     
     def _start_reader_thread(self):
         """Start background thread for reading RSP packets"""
@@ -630,7 +718,7 @@ class SPXConnection:
                     continue  # Timeout or error, continue loop
                 
                 # Check if it's O-packet (log output)
-                if (len(packet) > 2) and packet.startswith('O'):
+                if (len(packet) > 2) and packet.startswith(b'O'):
                     # Decode and handle O packet
                     log_msg = self._decode_o_packet(packet)
                     if log_msg:
@@ -638,7 +726,9 @@ class SPXConnection:
                             # Call custom callback for streaming
                             self._o_packet_callback(log_msg)
                         else:
-                            print(f"[LOG] {log_msg}", file=sys.stderr, end="")
+                            sys.stderr.write(f"[LOG] {log_msg}")
+                elif packet == b'+' or packet == b'-':
+                    self._ack_queue.put(packet)
                 else:
                     # Non-O packet, put it in the queue
                     self._response_queue.put(packet)
@@ -657,176 +747,138 @@ class SPXConnection:
                     print(f"[ERROR] Reader thread error: {e}", file=sys.stderr)
                 continue
     
-    def _read_packet_from_stream(self) -> Optional[str]:
+    def _fill_rx_buffer(self) -> bool:
         """
-        Read a single RSP packet from the stream (used by reader thread).
-        Returns None on timeout (non-blocking).
+        Append whatever the connection has available to the receive buffer (reader thread only).
+        Blocks for at most one read timeout. Returns False on timeout or shutdown.
         """
-        # Read first character - check for ACK/NAK or packet start
-        while True:
-            if self._reader_stop.is_set():
-                return None
-            
-            try:
-                b = self._read(1)
-            except (serial.serialutil.SerialException, OSError, socket.error) as e:
-                # If shutting down, return None silently
-                if self._reader_stop.is_set():
-                    return None
-                if "device reports readiness to read but returned no data" in str(e):
-                    return None  # Timeout, return None
-                # Bad file descriptor usually means port/socket was closed during shutdown
-                if "Bad file descriptor" in str(e) or "bad file descriptor" in str(e):
-                    return None
-                if isinstance(e, socket.timeout):
-                    return None  # TCP timeout
-                raise
-            
-            if len(b) == 0:
-                return None  # Timeout
-            
-            # Check for ACK/NAK
-            if b == b'+':
-                if self.verbose:
-                    print(f"< + (ack)", file=sys.stderr)
-                return '+'  # ACK
-            elif b == b'-':
-                if self.verbose:
-                    print(f"< - (nak)", file=sys.stderr)
-                return '-'  # NAK
-            elif b == b'$':
-                break  # Start of RSP packet
-            # Otherwise, skip and continue (might be noise)
-        
-        # Read packet data until '#'
-        data = bytearray()
-        while True:
-            if self._reader_stop.is_set():
-                return None
-            
-            try:
-                b = self._read(1)
-            except (serial.serialutil.SerialException, OSError, socket.error) as e:
-                # If shutting down, return None silently
-                if self._reader_stop.is_set():
-                    return None
-                if "device reports readiness to read but returned no data" in str(e):
-                    return None  # Timeout
-                # Bad file descriptor usually means port/socket was closed during shutdown
-                if "Bad file descriptor" in str(e) or "bad file descriptor" in str(e):
-                    return None
-                if isinstance(e, socket.timeout):
-                    return None  # TCP timeout
-                raise
-            
-            if len(b) == 0:
-                return None  # Timeout
-            if b == b'#':
-                break
-            data.append(b[0])
-        
-        # Read checksum (2 hex digits)
+        if self._reader_stop.is_set():
+            return False
         try:
-            checksum_hex = self._read(2)
+            if self.is_tcp:
+                data = self._read(4096)
+            else:
+                # pyserial's read(n) waits for all n bytes, so only ask for what is already queued
+                data = self._read(max(1, self.ser.in_waiting))
         except (serial.serialutil.SerialException, OSError, socket.error) as e:
-            # If shutting down, return None silently
+            # If shutting down, return silently
             if self._reader_stop.is_set():
-                return None
+                return False
             if "device reports readiness to read but returned no data" in str(e):
-                return None  # Timeout
+                return False  # Timeout
             # Bad file descriptor usually means port/socket was closed during shutdown
             if "Bad file descriptor" in str(e) or "bad file descriptor" in str(e):
-                return None
+                return False
             if isinstance(e, socket.timeout):
-                return None  # TCP timeout
+                return False  # TCP timeout
             raise
         
-        if len(checksum_hex) != 2:
-            return None  # Incomplete checksum
+        if len(data) == 0:
+            return False  # Timeout
+        self._rx_buffer += data
+        return True
+    
+    def _read_packet_from_stream(self) -> Optional[bytes]:
+        """
+        Read a single RSP packet from the stream (used by reader thread).
+        Returns None on timeout (non-blocking). A partially received packet stays
+        buffered and is completed by the next call.
+        """
+        buf = self._rx_buffer
+        
+        # Find ACK/NAK or packet start, skipping anything else (might be noise)
+        while True:
+            m = _RSP_FRAME_START_RE.search(buf)
+            if m is not None:
+                break
+            buf.clear()
+            if not self._fill_rx_buffer():
+                return None
+        
+        start = m.start()
+        if buf[start] != 0x24:  # '$'
+            ack = bytes(buf[start:start + 1])
+            del buf[:start + 1]
+            if self.verbose:
+                print(f"< {ack.decode('ascii')} ({'ack' if ack == b'+' else 'nak'})", file=sys.stderr)
+            return ack
+        del buf[:start]
+        
+        # Wait for '#' and the 2 checksum hex digits
+        while True:
+            end = buf.find(b'#', 1)
+            if end != -1 and len(buf) >= end + 3:
+                break
+            if not self._fill_rx_buffer():
+                return None
+        
+        data = bytes(buf[1:end])
+        checksum_hex = bytes(buf[end + 1:end + 3])
+        del buf[:end + 3]
         
         # Verify checksum
-        expected_checksum = int(checksum_hex.decode('ascii'), 16)
+        expected_checksum = _RSP_CHECKSUM_VALUE.get(checksum_hex, -1)  # -1: not hex, NAK it
         actual_checksum = self._calculate_checksum(data)
         
-        # Hex encoding is ASCII-safe
-        packet_str = data.decode('ascii', errors='replace')
-        
         if expected_checksum != actual_checksum:
             # Send NAK
             if self.verbose:
-                print(f"< ${packet_str}#{checksum_hex.decode('ascii')} (checksum mismatch)", file=sys.stderr)
+                packet_str = data.decode('ascii', errors='replace')
+                print(f"< ${packet_str}#{checksum_hex.decode('ascii', errors='replace')} (checksum mismatch)", file=sys.stderr)
                 print(f"> -", file=sys.stderr)
             self._write(b'-')
             return None  # Don't raise, just return None
         
         # Send ACK
         if self.verbose:
-            print(f"< ${packet_str}#{checksum_hex.decode('ascii')}", file=sys.stderr)
+            packet_str = data.decode('ascii', errors='replace')
+            print(f"< ${packet_str}#{checksum_hex.decode('ascii', errors='replace')}", file=sys.stderr)
             print(f"> +", file=sys.stderr)
         self._write(b'+')
 
-        return packet_str
+        # Left as bytes: payloads such as pread data are hex-decoded straight from it
+        return data
     
     def _read_ack_nak(self) -> bool:
         """Read ACK/NAK from queue"""
         try:
-            response = self._response_queue.get(timeout=5.0)
-            if response == '+':
-                return True  # ACK
-            elif response == '-':
-                return False  # NAK
-            else:
-                raise RSPIOError(f"Unexpected response while waiting for ACK/NAK: {response}")
+            response = self._ack_queue.get(timeout=5.0)
         except queue.Empty:
             raise RSPIOError("Timeout waiting for ACK/NAK")
+        return response == b'+'
     
     def _calculate_checksum(self, data: bytes) -> int:
         """Calculate RSP checksum (sum of bytes mod 256)"""
-        return sum(data) % 256
+        if len(data) <= 256:
+            return sum(data) & 0xFF
+        # adler32 started from 0 leaves the plain byte sum (mod 65521) in its low 16 bits;
+        # 256 bytes sum to at most 65280, so per-256-byte blocks are exact and summed in C.
+        view = memoryview(data)
+        return sum([zlib.adler32(view[i:i + 256], 0) & 0xFFFF for i in range(0, len(view), 256)]) & 0xFF
     
     def _encode_binary_escaped(self, data: bytes) -> bytes:
         """Encode binary data with RSP escaping"""
-        result = bytearray()
-        for b in data:
-            if b in (ord('}'), ord('#'), ord('$'), ord('*')):
-                result.append(ord('}'))
-                result.append(b ^ 0x20)
-            else:
-                result.append(b)
-        return bytes(result)
+        return _RSP_ESCAPE_RE.sub(lambda m: _RSP_ESCAPES[m[0]], data)
     
     def _decode_binary_escaped(self, data: bytes) -> bytes:
         """Decode binary-escaped data"""
-        result = bytearray()
-        i = 0
-        while i < len(data):
-            b = data[i]
-            if b == ord('}'):
-                if i + 1 < len(data):
-                    result.append(data[i + 1] ^ 0x20)
-                    i += 2
-                else:
-                    # Invalid escape sequence
-                    break
-            else:
-                result.append(b)
-                i += 1
-        return bytes(result)
+        # A trailing '}' with nothing after it is an invalid escape and is dropped
+        return _RSP_UNESCAPE_RE.sub(lambda m: bytes((m[0][1] ^ 0x20,)) if len(m[0]) == 2 else b'', data)
     
     def _encode_path(self, path: str) -> str:
         """Encode path as ASCII-hex"""
-        return binascii.hexlify(path.encode('utf-8')).decode('ascii')
+        return path.encode('utf-8').hex()
     
     def _decode_path(self, hex_str: str) -> str:
         """Decode ASCII-hex path"""
         return binascii.unhexlify(hex_str).decode('utf-8')
     
-    def _send_packet(self, packet: str) -> None:
-        """Send RSP packet and wait for ACK/NAK"""
+    def _send_packet(self, packet: Union[str, bytes]) -> None:
+        """Send RSP packet (str, or already-encoded bytes) and wait for ACK/NAK"""
         # Hex encoding is ASCII-safe, so we can use ascii encoding
-        data = packet.encode('ascii')
+        data = packet.encode('ascii') if isinstance(packet, str) else packet
         checksum = self._calculate_checksum(data)
-        packet_bytes = f"${packet}#{checksum:02x}".encode('ascii')
+        packet_bytes = b"$" + data + _RSP_CHECKSUM_SUFFIX[checksum]
         
         if self.verbose:
             print(f"> {packet_bytes.decode('ascii', errors='replace')}", file=sys.stderr)
@@ -855,14 +907,14 @@ class SPXConnection:
         
         raise RSPIOError("Failed to send packet after retries")
     
-    def _send_packet_with_response(self, packet: str, timeout: Optional[float] = 5.0) -> str:
+    def _send_packet_with_response(self, packet: Union[str, bytes], timeout: Optional[float] = 5.0) -> str:
         """Send packet and return response payload"""
         self._send_packet(packet)
         return self._read_response(timeout=timeout)
     
-    def _decode_o_packet(self, packet: str) -> str:
+    def _decode_o_packet(self, packet: bytes) -> str:
         """Decode O packet (log output) - hex-encoded text"""
-        if not packet.startswith('O'):
+        if not packet.startswith(b'O'):
             return ""
         
         hex_data = packet[1:]
@@ -874,8 +926,8 @@ class SPXConnection:
     
     def _read_response(self, timeout: Optional[float] = 5.0) -> str:
         """
-        Read RSP response packet from queue (O packets are already handled by reader thread).
-        Skips any ACK/NAK that might be in the queue (those are handled by _read_ack_nak).
+        Read RSP response packet from queue (O packets are already handled by reader thread,
+        ACK/NAK go to the separate ACK queue).
         
         Args:
             timeout: Timeout in seconds to wait for response. If None, wait forever.
@@ -883,29 +935,15 @@ class SPXConnection:
         Returns:
             Response packet payload
         """
-        start_time = time.time()
-        while True:
-            if timeout is not None:
-                elapsed = time.time() - start_time
-                if elapsed >= timeout:
-                    raise RSPIOError("Timeout waiting for response")
-                remaining_timeout = timeout - elapsed
-            else:
-                # No timeout - wait forever
-                remaining_timeout = None
-            
-            try:
-                packet = self._response_queue.get(timeout=remaining_timeout)
-                # Skip ACK/NAK - those are handled by _read_ack_nak
-                if packet == '+' or packet == '-':
-                    continue
-                # This is the actual response packet
-                return packet
-            except queue.Empty:
-                if timeout is not None:
-                    raise RSPIOError("Timeout waiting for response")
-                # If timeout is None, continue waiting (shouldn't happen, but be safe)
-                continue
+        # Hex encoding is ASCII-safe
+        return self._read_raw_response(timeout).decode('ascii', errors='replace')
+    
+    def _read_raw_response(self, timeout: Optional[float] = 5.0) -> bytes:
+        """Like _read_response, but return the payload bytes without decoding to str"""
+        try:
+            return self._response_queue.get(timeout=timeout)
+        except queue.Empty:
+            raise RSPIOError("Timeout waiting for response")
     
     def _verify_support(self):
         """Verify vSpectranext support via qSupported and parse packet size"""
@@ -914,19 +952,15 @@ class SPXConnection:
             raise RSPNotSupportedError("Device does not support vSpectranext protocol")
         
         # Parse PacketSize from response (format: "PacketSize=1000;..." where 1000 is hex)
-        if "PacketSize=" in response:
+        _, found, rest = (";" + response).partition(";PacketSize=")
+        if found:
+            packet_size_hex = rest.partition(";")[0]
             try:
-                # Extract PacketSize value
-                parts = response.split(";")
-                for part in parts:
-                    if part.startswith("PacketSize="):
-                        packet_size_hex = part.split("=")[1]
-                        # Parse as hex (as per GDB RSP spec)
-                        self.max_packet_size = int(packet_size_hex, 16)
-                        if self.verbose:
-                            print(f"[INFO] Using packet size: {self.max_packet_size} (0x{packet_size_hex})", file=sys.stderr)
-                        break
-            except (ValueError, IndexError) as e:
+                # Parse as hex (as per GDB RSP spec)
+                self.max_packet_size = int(packet_size_hex, 16)
+                if self.verbose:
+                    print(f"[INFO] Using packet size: {self.max_packet_size} (0x{packet_size_hex})", file=sys.stderr)
+            except ValueError as e:
                 # If parsing fails, use default
                 if self.verbose:
                     print(f"[WARN] Failed to parse PacketSize from '{response}', using default 1024: {e}", file=sys.stderr)
@@ -939,20 +973,21 @@ class SPXConnection:
             return int(response[1:])
         return 0
     
+    def _parse_f_result(self, response: str, message: str) -> int:
+        """Parse an F<hex> vFile result, raising the matching exception for F-1,<errno>"""
+        if response.startswith("F-1,"):
+            self._raise_error(self._parse_errno(response), message)
+        if not response.startswith("F"):
+            raise RSPIOError(f"Unexpected response: {response}")
+        return int(response[1:], 16)
+    
     def _raise_error(self, errno: int, message: str = ""):
         """Raise appropriate exception based on errno"""
-        if errno == 2:  # ENOENT
-            raise RSPNotFoundError(message or "File or directory not found")
-        elif errno == 5:  # EIO
-            raise RSPIOError(message or "I/O error")
-        elif errno == 13:  # EACCES
-            raise RSPPermissionError(message or "Permission denied")
-        elif errno == 17:  # EEXIST
-            raise RSPExistsError(message or "Already exists")
-        elif errno == 22:  # EINVAL
-            raise RSPInvalidError(message or "Invalid parameter")
-        else:
+        mapped = _ERRNO_EXCEPTIONS.get(errno)
+        if mapped is None:
             raise RSPIOError(message or f"I/O error (errno: {errno})")
+        exc_class, default_message = mapped
+        raise exc_class(message or default_message)
     
     # vFile operations
     def _vfile_open(self, path: str, flags: int, mode: int) -> int:
@@ -963,16 +998,8 @@ class SPXConnection:
         packet = f"vFile:open:0,{flags:x},{mode:x},{hex_path}"
         response = self._send_packet_with_response(packet)
         
-        if response.startswith("F-1,"):
-            errno = self._parse_errno(response)
-            self._raise_error(errno, f"Failed to open {path}")
-        
         # Parse F<fd>
-        if not response.startswith("F"):
-            raise RSPIOError(f"Unexpected response: {response}")
-        
-        fd_hex = response[1:]
-        return int(fd_hex, 16)
+        return self._parse_f_result(response, f"Failed to open {path}")
     
     def _vfile_close(self, fd: int) -> None:
         """Close file via vFile:close"""
@@ -986,8 +1013,8 @@ class SPXConnection:
         if response != "F0":
             raise RSPIOError(f"Unexpected response: {response}")
     
-    def _vfile_pread(self, fd: int, count: int) -> bytes:
-        """Read from file via vFile:pread (sequential read, no offset)"""
+    def _vfile_pread_packet(self, fd: int, count: int) -> Tuple[bytes, int]:
+        """Build a vFile:pread packet; returns the packet and the (possibly reduced) count"""
         # Limit count to fit in RSP packet (account for hex encoding overhead)
         # Response format: hex data only (2 hex digits per byte, no count prefix)
         # Need space for:
@@ -998,11 +1025,12 @@ class SPXConnection:
         if count > max_binary:
             count = max_binary
         
-        packet = f"vFile:pread:{fd:x},{count:x}"
-        response = self._send_packet_with_response(packet)
-        
-        if response.startswith("F-1,"):
-            errno = self._parse_errno(response)
+        return b"vFile:pread:%x,%x" % (fd, count), count
+    
+    def _vfile_pread_result(self, response: bytes) -> bytes:
+        """Parse a raw vFile:pread response into file data"""
+        if response.startswith(b"F-1,"):
+            errno = self._parse_errno(response.decode('ascii', errors='replace'))
             self._raise_error(errno, "Failed to read file")
         
         # Parse hex data (no count prefix, just hex data)
@@ -1017,8 +1045,14 @@ class SPXConnection:
         
         return data_bytes
     
-    def _vfile_pwrite(self, fd: int, data: bytes) -> int:
-        """Write to file via vFile:pwrite (sequential write, no offset)"""
+    def _vfile_pread(self, fd: int, count: int) -> bytes:
+        """Read from file via vFile:pread (sequential read, no offset)"""
+        packet, _ = self._vfile_pread_packet(fd, count)
+        self._send_packet(packet)
+        return self._vfile_pread_result(self._read_raw_response())
+    
+    def _vfile_pwrite_packet(self, fd: int, data: bytes) -> Tuple[bytes, int]:
+        """Build a vFile:pwrite packet; returns the packet and the number of bytes it carries"""
         # Limit chunk size to fit in RSP packet
         # Packet format: "vFile:pwrite:<fd>,<hex-data>"
         # Reserve ~25 bytes for packet overhead (prefix + checksum)
@@ -1027,22 +1061,19 @@ class SPXConnection:
         if len(data) > max_binary:
             data = data[:max_binary]
         
-        # Encode data as hex (two hex digits per byte)
-        hex_data = binascii.hexlify(data).decode('ascii')
-        
-        packet = f"vFile:pwrite:{fd:x},{hex_data}"
-        response = self._send_packet_with_response(packet)
-        
-        if response.startswith("F-1,"):
-            errno = self._parse_errno(response)
-            self._raise_error(errno, "Failed to write file")
-        
+        # Encode data as hex (two hex digits per byte), built as bytes so the payload
+        # is not round-tripped through str
+        return b"vFile:pwrite:%x,%s" % (fd, binascii.hexlify(data)), len(data)
+    
+    def _vfile_pwrite_result(self, response: str) -> int:
+        """Parse a vFile:pwrite response into the number of bytes written"""
         # Parse F<count>
-        if not response.startswith("F"):
-            raise RSPIOError(f"Unexpected response: {response}")
-        
-        count_hex = response[1:]
-        return int(count_hex, 16)
+        return self._parse_f_result(response, "Failed to write file")
+    
+    def _vfile_pwrite(self, fd: int, data: bytes) -> int:
+        """Write to file via vFile:pwrite (sequential write, no offset)"""
+        packet, _ = self._vfile_pwrite_packet(fd, data)
+        return self._vfile_pwrite_result(self._send_packet_with_response(packet))
     
     def _vfile_size(self, path: str) -> int:
         """Get file size via vFile:size"""
@@ -1050,16 +1081,8 @@ class SPXConnection:
         packet = f"vFile:size:{hex_path}"
         response = self._send_packet_with_response(packet)
         
-        if response.startswith("F-1,"):
-            errno = self._parse_errno(response)
-            self._raise_error(errno, f"Failed to get size of {path}")
-        
         # Parse F<size>
-        if not response.startswith("F"):
-            raise RSPIOError(f"Unexpected response: {response}")
-        
-        size_hex = response[1:]
-        return int(size_hex, 16)
+        return self._parse_f_result(response, f"Failed to get size of {path}")
     
     def _vfile_exists(self, path: str) -> bool:
         """Check if file exists via vFile:exists"""
@@ -1078,18 +1101,23 @@ class SPXConnection:
         else:
             raise RSPIOError(f"Unexpected response: {response}")
     
-    def _vfile_unlink(self, path: str) -> None:
-        """Delete file via vFile:unlink"""
-        hex_path = self._encode_path(path)
-        packet = f"vFile:unlink:{hex_path}"
-        response = self._send_packet_with_response(packet)
-        
+    def _vfile_unlink_packet(self, path: str) -> str:
+        """Build a vFile:unlink packet"""
+        return f"vFile:unlink:{self._encode_path(path)}"
+    
+    def _vfile_unlink_result(self, response: str, path: str) -> None:
+        """Check a vFile:unlink response"""
         if response.startswith("F-1,"):
             errno = self._parse_errno(response)
             self._raise_error(errno, f"Failed to delete {path}")
         
         if response != "F0":
             raise RSPIOError(f"Unexpected response: {response}")
+    
+    def _vfile_unlink(self, path: str) -> None:
+        """Delete file via vFile:unlink"""
+        response = self._send_packet_with_response(self._vfile_unlink_packet(path))
+        self._vfile_unlink_result(response, path)
 
     def _vfile_commit(self, path: str) -> None:
         """Commit file or directory to flash via vFile:commit"""
@@ -1107,13 +1135,13 @@ class SPXConnection:
     # vSpectranext operations
     def _vspectranext_reboot(self) -> None:
         """Reboot device via vSpectranext:reboot"""
-        response = self._send_packet_with_response("vSpectranext:reboot")
+        response = self._send_packet_with_response(self._PKT_REBOOT)
         if response != "OK":
             raise RSPIOError(f"Unexpected response: {response}")
     
     def _vspectranext_autoboot(self) -> None:
         """Configure autoboot and reboot via vSpectranext:autoboot"""
-        response = self._send_packet_with_response("vSpectranext:autoboot")
+        response = self._send_packet_with_response(self._PKT_AUTOBOOT)
         if response != "OK":
             raise RSPIOError(f"Unexpected response: {response}")
     
@@ -1132,8 +1160,10 @@ class SPXConnection:
     
     def _vspectranext_readdir(self) -> Optional[Tuple[str, str, int, int]]:
         """Read directory entry via vSpectranext:readdir"""
-        response = self._send_packet_with_response("vSpectranext:readdir")
-        
+        return self._vspectranext_readdir_result(self._send_packet_with_response(self._PKT_READDIR))
+    
+    def _vspectranext_readdir_result(self, response: str) -> Optional[Tuple[str, str, int, int]]:
+        """Parse a vSpectranext:readdir response; None at end of directory"""
         if response == "":
             return None  # End of directory
         
@@ -1159,7 +1189,7 @@ class SPXConnection:
     
     def _vspectranext_closedir(self) -> None:
         """Close directory via vSpectranext:closedir"""
-        response = self._send_packet_with_response("vSpectranext:closedir")
+        response = self._send_packet_with_response(self._PKT_CLOSEDIR)
         
         if response.startswith("E"):
             errno = self._parse_errno(response)
@@ -1209,30 +1239,56 @@ class SPXConnection:
             raise RSPIOError(f"Unexpected response: {response}")
     
     # High-level API
-    def ls(self, path: str = "/") -> List[Tuple[str, str, int, int]]:
+    def iter_ls(self, path: str = "/") -> Iterator[Tuple[str, str, int, int]]:
         """
-        List directory contents.
+        Iterate over directory contents as they are read from the device.
+        
+        The directory stays open until the generator is exhausted or closed,
+        so don't issue other commands on this connection while iterating.
         
         Args:
             path: Directory path (default: "/")
             
-        Returns:
-            List of tuples: (type, name, size, storage) where type is 'D' or 'F',
+        Yields:
+            Tuples: (type, name, size, storage) where type is 'D' or 'F',
             and storage is 0 for RAM or 1 for flash.
         """
         self._vspectranext_opendir(path)
-        entries = []
+        in_flight = 0  # readdir requests sent but not yet answered
         try:
             while True:
-                entry = self._vspectranext_readdir()
+                # readdir takes no argument and is answered in order, so the next few
+                # can be requested before the current reply arrives
+                while in_flight < READDIR_PIPELINE_DEPTH:
+                    self._send_packet(self._PKT_READDIR)
+                    in_flight += 1
+                in_flight -= 1
+                entry = self._vspectranext_readdir_result(self._read_response())
                 if entry is None:
                     break
                 name, entry_type, size, storage = entry
-                entries.append((entry_type, name, size, storage))
+                yield (entry_type, name, size, storage)
         finally:
-            self._vspectranext_closedir()
+            # Collect replies still in flight (requests past the end included)
+            try:
+                while in_flight:
+                    in_flight -= 1
+                    self._read_response()
+            finally:
+                self._vspectranext_closedir()
+    
+    def ls(self, path: str = "/") -> List[Tuple[str, str, int, int]]:
+        """
+        List directory contents.
         
-        return entries
+        Args:
+            path: Directory path (default: "/")
+            
+        Returns:
+            List of tuples: (type, name, size, storage) where type is 'D' or 'F',
+            and storage is 0 for RAM or 1 for flash.
+        """
+        return list(self.iter_ls(path))
     
     def _format_size(self, size: int) -> str:
         """Format size in human-readable format"""
@@ -1243,10 +1299,15 @@ class SPXConnection:
         return f"{size:.1f} TB"
     
     def _show_progress(self, transferred: int, total: int, operation: str = "Transfer"):
-        """Show progress indicator"""
+        """Show progress indicator (redrawn at most every 50 ms, plus the final update)"""
         if not self.show_progress:
             return
         
+        now = time.monotonic()
+        if transferred < total and now - self._last_progress_time < 0.05:
+            return
+        self._last_progress_time = now
+        
         percent = (transferred / total * 100) if total > 0 else 0
         bar_width = 40
         filled = int(bar_width * transferred / total) if total > 0 else 0
@@ -1258,83 +1319,200 @@ class SPXConnection:
         sys.stdout.write(f"\r{operation}: [{bar}] {percent:.1f}% ({transferred_str}/{total_str})")
         sys.stdout.flush()
     
+    def _vfile_size_and_open(self, path: str) -> Tuple[int, int]:
+        """
+        Query size and open for reading with vFile:size and vFile:open sent back to back,
+        saving a round trip. Returns (fd, size).
+        """
+        hex_path = self._encode_path(path)
+        self._send_packet(f"vFile:size:{hex_path}")
+        self._send_packet(f"vFile:open:0,0,0,{hex_path}")  # O_RDONLY
+        size_response = self._read_response()
+        open_response = self._read_response()
+        
+        try:
+            file_size = self._parse_f_result(size_response, f"Failed to get size of {path}")
+        except RSPException:
+            # Don't leave the file open if only the size query failed
+            if open_response.startswith("F") and not open_response.startswith("F-1,"):
+                self._vfile_close(int(open_response[1:], 16))
+            raise
+        return self._parse_f_result(open_response, f"Failed to open {path}"), file_size
+    
+    def _pread_chunks(self, fd: int, file_size: int) -> Iterator[bytes]:
+        """
+        Read up to file_size bytes from an open fd, keeping up to PREAD_PIPELINE_DEPTH
+        vFile:pread requests in flight so the device is already working on the next chunk
+        while the previous one is handled. pread has no offset; the device answers in order
+        from the fd's position. Does not close the fd.
+        """
+        in_flight = collections.deque()  # requested byte count per outstanding pread
+        try:
+            requested = 0
+            transferred = 0
+            while transferred < file_size:
+                while len(in_flight) < PREAD_PIPELINE_DEPTH and requested < file_size:
+                    packet, count = self._vfile_pread_packet(fd, file_size - requested)
+                    self._send_packet(packet)
+                    in_flight.append(count)
+                    requested += count
+                
+                # Count the reply off before reading it, so an error reply (or a
+                # timeout) isn't waited for again by the drain below
+                count = in_flight.popleft()
+                chunk_data = self._vfile_pread_result(self._read_raw_response())
+                if len(chunk_data) == 0:
+                    break
+                # A short read leaves the shortfall to be requested again
+                requested -= count - len(chunk_data)
+                transferred += len(chunk_data)
+                yield chunk_data
+        finally:
+            # Collect replies still in flight so they are not taken for later responses
+            while in_flight:
+                in_flight.popleft()
+                self._read_raw_response()
+
+    def get_stream(self, remote_path: str, file_size: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Read file from RAMFS incrementally.
+
+        Args:
+            remote_path: Path on device
+            file_size: File size if already known (queried from the device otherwise)
+
+        Yields:
+            Chunks of file data, each at most one RSP packet's worth
+        """
+        if file_size is None:
+            fd, file_size = self._vfile_size_and_open(remote_path)
+        else:
+            fd = self._vfile_open(remote_path, 0, 0)  # O_RDONLY
+
+        chunks = self._pread_chunks(fd, file_size)
+        try:
+            yield from chunks
+        finally:
+            try:
+                chunks.close()
+            finally:
+                self._vfile_close(fd)
+
     def get(self, remote_path: str, local_path: str):
         """
         Download file from RAMFS.
-        
+
         Args:
             remote_path: Path on device
             local_path: Local file path
         """
-        # Get file size
-        file_size = self._vfile_size(remote_path)
-        
-        if self.show_progress:
-            print(f"Downloading {remote_path} -> {local_path} ({self._format_size(file_size)})")
-        
-        # Open file
-        fd = self._vfile_open(remote_path, 0, 0)  # O_RDONLY
-        
+        fd, file_size = self._vfile_size_and_open(remote_path)
+        chunks = self._pread_chunks(fd, file_size)
         try:
+            if self.show_progress:
+                print(f"Downloading {remote_path} -> {local_path} ({self._format_size(file_size)})")
+
             transferred = 0
             start_time = time.time()
-            
-            with open(local_path, 'wb') as f:
-                while transferred < file_size:
-                    # Read chunk sequentially (limited by RSP packet size)
-                    remaining = file_size - transferred
-                    chunk_data = self._vfile_pread(fd, remaining)
-                    if len(chunk_data) == 0:
-                        break
-                    
+
+            # Chunks are at most half a packet; batch them into fewer write() calls
+            with open(local_path, 'wb', buffering=1 << 16) as f:
+                for chunk_data in chunks:
                     f.write(chunk_data)
                     transferred += len(chunk_data)
                     self._show_progress(transferred, file_size, "Downloading")
         finally:
-            self._vfile_close(fd)
-        
+            try:
+                chunks.close()
+            finally:
+                self._vfile_close(fd)
+
         if self.show_progress:
             elapsed = time.time() - start_time
             speed = transferred / elapsed if elapsed > 0 else 0
             print(f"\nDownloaded {self._format_size(transferred)} in {elapsed:.1f}s ({self._format_size(speed)}/s)")
     
-    def put(self, local_path: str, remote_path: str):
+    def put(self, local_path: Union[str, BinaryIO], remote_path: str):
         """
         Upload file to RAMFS.
         
         Args:
-            local_path: Local file path
+            local_path: Local file path, or a binary file object open for reading
             remote_path: Path on device
         """
-        file_size = os.path.getsize(local_path)
+        if not hasattr(local_path, 'read'):
+            with open(local_path, 'rb') as f:
+                return self.put(f, remote_path)
+
+        f = local_path
+        source_name = getattr(f, 'name', '<stream>')
+        try:
+            # Remaining bytes from the current position; used for progress only
+            pos = f.tell()
+            file_size = f.seek(0, os.SEEK_END) - pos
+            f.seek(pos)
+        except (AttributeError, OSError, ValueError):
+            file_size = 0
         
         if self.show_progress:
-            print(f"Uploading {local_path} -> {remote_path} ({self._format_size(file_size)})")
+            print(f"Uploading {source_name} -> {remote_path} ({self._format_size(file_size)})")
         
         # Open file (O_WRONLY | O_CREAT | O_TRUNC)
         # O_WRONLY=1 (accmode), O_CREAT=0x0100, O_TRUNC=0x0200
         # Combined: 0x0201 (O_WRONLY=1 in accmode, O_TRUNC=0x0200 which also sets O_CREAT)
         fd = self._vfile_open(remote_path, 0x0201, 0)  # O_WRONLY | O_TRUNC (which includes O_CREAT)
         
+        in_flight = collections.deque()  # byte count carried by each pwrite not yet answered
         try:
             transferred = 0
             start_time = time.time()
+            # Limit to packet size: (max_packet_size - 25) / 2
+            max_chunk = (self.max_packet_size - 25) // 2
+            eof = False
+            # Read into one reusable buffer when the source supports it; each packet
+            # takes its own hex copy, so the buffer is free again once sent
+            readinto = getattr(f, 'readinto', None)
+            if readinto is not None:
+                buf = bytearray(max_chunk)
+                view = memoryview(buf)
             
-            with open(local_path, 'rb') as f:
-                while transferred < file_size:
-                    # Read chunk from local file
-                    # Limit to packet size: (max_packet_size - 25) / 2
-                    max_chunk = (self.max_packet_size - 25) // 2
-                    chunk = f.read(max_chunk)
+            while True:
+                # Keep up to PWRITE_PIPELINE_DEPTH chunks in flight; pwrite has no offset,
+                # the device appends them in the order they are ACKed
+                while not eof and len(in_flight) < PWRITE_PIPELINE_DEPTH:
+                    if readinto is not None:
+                        n = readinto(buf)
+                        chunk = view[:n] if n else None
+                    else:
+                        chunk = f.read(max_chunk)
                     if not chunk:
+                        eof = True
                         break
-                    
-                    # Write chunk sequentially (no offset)
-                    bytes_written = self._vfile_pwrite(fd, chunk)
-                    transferred += bytes_written
-                    self._show_progress(transferred, file_size, "Uploading")
+                    packet, sent = self._vfile_pwrite_packet(fd, chunk)
+                    self._send_packet(packet)
+                    in_flight.append(sent)
+                if not in_flight:
+                    break
+                
+                sent = in_flight.popleft()
+                bytes_written = self._vfile_pwrite_result(self._read_response())
+                # Later chunks are already queued behind this one, so a short write
+                # can't be resent in place; stop rather than leave a gap in the file
+                if bytes_written != sent:
+                    raise RSPIOError(
+                        f"Short write to {remote_path}: device wrote {bytes_written} of "
+                        f"{sent} bytes at offset {transferred}"
+                    )
+                transferred += bytes_written
+                self._show_progress(transferred, max(file_size, transferred), "Uploading")
         finally:
-            self._vfile_close(fd)
+            # Collect replies still in flight so they are not taken for later responses
+            try:
+                while in_flight:
+                    in_flight.popleft()
+                    self._read_response()
+            finally:
+                self._vfile_close(fd)
         
         if self.show_progress:
             elapsed = time.time() - start_time
@@ -1349,6 +1527,79 @@ class SPXConnection:
             path: File path
         """
         self._vfile_unlink(path)
+    
+    def rm_many(self, paths: List[str]) -> Iterator[Tuple[str, Optional[RSPException]]]:
+        """
+        Delete several files, keeping up to UNLINK_PIPELINE_DEPTH vFile:unlink
+        requests in flight. Like rm, a file the device refuses to delete does
+        not stop the rest; link errors still raise.
+        
+        Args:
+            paths: File paths
+            
+        Yields:
+            (path, None) for each deleted file, or (path, error) for one that
+            was not deleted, in the order given
+        """
+        in_flight = collections.deque()  # paths of unlinks sent but not yet answered
+        try:
+            for path in paths:
+                if len(in_flight) == UNLINK_PIPELINE_DEPTH:
+                    yield self._unlink_outcome(in_flight)
+                self._send_packet(self._vfile_unlink_packet(path))
+                in_flight.append(path)
+            while in_flight:
+                yield self._unlink_outcome(in_flight)
+        finally:
+            # Collect replies still in flight so they are not taken for later responses
+            while in_flight:
+                in_flight.popleft()
+                self._read_response()
+    
+    def _unlink_outcome(self, in_flight: collections.deque) -> Tuple[str, Optional[RSPException]]:
+        """Read the reply to the oldest unlink in flight; returns (path, error or None)"""
+        # Pop before reading, so a failed read isn't waited for again by the drain
+        path = in_flight.popleft()
+        response = self._read_response()
+        try:
+            self._vfile_unlink_result(response, path)
+        except RSPException as e:
+            return path, e
+        return path, None
+    
+    def rmtree(self, path: str):
+        """
+        Remove a directory and everything below it. A plain file is just deleted.
+        
+        Args:
+            path: Directory or file path
+        """
+        try:
+            # ls() reads the whole listing first, so the directory is closed before recursing
+            entries = self.ls(path)
+        except (RSPNotFoundError, RSPIOError) as e:
+            # opendir fails with ENOENT/ENOTDIR on a file; unlink it instead
+            try:
+                self.rm(path)
+            except RSPException:
+                raise e
+            return
+        files = []
+        subdirs = []
+        for entry_type, name, size, storage in entries:
+            if name in ('.', '..'):
+                continue
+            entry_path = _remote_join(path, name)
+            if entry_type == 'D':
+                subdirs.append(entry_path)
+            else:
+                files.append(entry_path)
+        errors = [error for done, error in self.rm_many(files) if error is not None]
+        if errors:
+            raise errors[0]
+        for subdir in subdirs:
+            self.rmtree(subdir)
+        self.rmdir(path)
 
     def commit(self, path: str):
         """
@@ -1453,37 +1704,16 @@ class SPXConnection:
         # Stop reader thread
         if self._reader_thread is not None:
             self._reader_stop.set()
-            # Reduce timeout so reader thread wakes up faster
-            old_timeout = None
-            if self.is_tcp:
-                if self.sock:
-                    try:
-                        old_timeout = self.sock.gettimeout()
-                        self.sock.settimeout(0.01)  # Very short timeout to wake up quickly
-                    except:
-                        pass  # Ignore errors when setting timeout
-            else:
-                if self.ser and self.ser.is_open:
-                    try:
-                        old_timeout = self.ser.timeout
-                        self.ser.timeout = 0.01  # Very short timeout to wake up quickly
-                    except:
-                        pass  # Ignore errors when setting timeout (port may be closing)
-            self._reader_thread.join(timeout=0.1)  # Reduced join timeout
-            # Restore timeout if connection is still open
-            if old_timeout is not None:
+            # Wake the reader out of its blocking read right away
+            try:
                 if self.is_tcp:
                     if self.sock:
-                        try:
-                            self.sock.settimeout(old_timeout)
-                        except:
-                            pass
-                else:
-                    if self.ser and self.ser.is_open:
-                        try:
-                            self.ser.timeout = old_timeout
-                        except:
-                            pass  # Ignore errors when restoring timeout
+                        self.sock.shutdown(socket.SHUT_RDWR)
+                elif self.ser and self.ser.is_open:
+                    self.ser.cancel_read()
+            except (OSError, AttributeError, serial.SerialException):
+                pass  # Already closed, or cancel_read unsupported; the read timeout still applies
+            self._reader_thread.join(timeout=0.5)
             self._reader_thread = None
         
         # Close connection
@@ -1496,6 +1726,10 @@ class SPXConnection:
                 self.sock = None
         else:
             if self.ser and self.ser.is_open:
+                try:
+                    self._flush()  # Let the last bytes (e.g. final ACK) reach the device
+                except:
+                    pass
                 self.ser.close()
         
         # Release lock
@@ -1528,111 +1762,189 @@ class SPXConnection:
 
 
 # Command-line interface functions
-def cmd_ls(args, show_progress: bool = True, verbose: bool = False):
-    """List directory"""
+def _wait_for_stop(stop: threading.Event, seconds: Optional[float]) -> None:
+    """
+    Block until stop is set or seconds have passed (forever if None).
+    Waits in slices of at most 0.5 s so a Ctrl-C handler still runs promptly on
+    platforms where signals don't interrupt a lock wait (Windows).
+    """
+    deadline = None if seconds is None else time.monotonic() + seconds
+    while True:
+        timeout = 0.5
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            timeout = min(remaining, timeout)
+        if stop.wait(timeout):
+            return
+
+
+@contextlib.contextmanager
+def _connection(args, show_progress: bool, verbose: bool,
+                conn: Optional[SPXConnection] = None) -> Iterator[SPXConnection]:
+    """Yield conn if given (left open for the caller), else a new connection closed on exit"""
+    if conn is not None:
+        yield conn
+        return
     conn = SPXConnection(args.port, show_progress=show_progress, verbose=verbose)
     try:
-        entries = conn.ls(args.path)
-        for entry_type, name, size, storage in entries:
+        yield conn
+    finally:
+        conn.close()
+
+
+def cmd_ls(args, show_progress: bool = True, verbose: bool = False,
+           conn: Optional[SPXConnection] = None):
+    """List directory"""
+    with _connection(args, show_progress, verbose, conn) as conn:
+        for entry_type, name, size, storage in conn.iter_ls(args.path):
             storage_name = "committed" if storage == 1 else "ram"
             if entry_type == 'D':
                 print(f"d {name:30s} {size:10d} {storage_name}")
             else:
                 print(f"f {name:30s} {size:10d} {storage_name}")
-    finally:
-        conn.close()
 
 
-def cmd_get(args, show_progress: bool = True, verbose: bool = False):
-    """Download file"""
-    conn = SPXConnection(args.port, show_progress=show_progress, verbose=verbose)
-    try:
+def _get_tree(conn: SPXConnection, remote_dir: str, local_dir: str, show_progress: bool):
+    """Download a remote directory tree file by file over one connection"""
+    os.makedirs(local_dir, exist_ok=True)
+    # ls() reads the whole listing first, so the directory is closed before recursing
+    for entry_type, name, size, storage in conn.ls(remote_dir):
+        if name in ('.', '..'):
+            continue
+        remote_path = _remote_join(remote_dir, name)
+        local_path = os.path.join(local_dir, name)
+        if entry_type == 'D':
+            _get_tree(conn, remote_path, local_path, show_progress)
+        else:
+            conn.get(remote_path, local_path)
+            if not show_progress:
+                print(f"Downloaded {remote_path} -> {local_path}")
+
+
+def _walk_error(err: OSError):
+    """os.walk() onerror callback: fail instead of skipping an unreadable directory"""
+    if isinstance(err, PermissionError):
+        raise RSPPermissionError(f"Cannot read local directory {err.filename}")
+    raise RSPIOError(f"Cannot read local directory {err.filename}: {err.strerror}")
+
+
+def _put_tree(conn: SPXConnection, local_dir: str, remote_dir: str, show_progress: bool):
+    """Upload a local directory tree file by file over one connection"""
+    for root, dirs, files in os.walk(local_dir, onerror=_walk_error):
+        dirs.sort()
+        rel = os.path.relpath(root, local_dir)
+        remote_root = remote_dir
+        if rel != os.curdir:
+            for part in rel.split(os.sep):
+                remote_root = _remote_join(remote_root, part)
+        if remote_root.rstrip('/'):
+            try:
+                conn.mkdir(remote_root)
+            except RSPExistsError:
+                pass
+        for name in sorted(files):
+            local_path = os.path.join(root, name)
+            remote_path = _remote_join(remote_root, name)
+            conn.put(local_path, remote_path)
+            if not show_progress:
+                print(f"Uploaded {local_path} -> {remote_path}")
+
+
+def cmd_get(args, show_progress: bool = True, verbose: bool = False,
+            conn: Optional[SPXConnection] = None):
+    """Download file (or directory tree with -r)"""
+    with _connection(args, show_progress, verbose, conn) as conn:
+        if args.recursive:
+            _get_tree(conn, args.remote, args.local, show_progress)
+            return
         conn.get(args.remote, args.local)
         if not show_progress:
             print(f"Downloaded {args.remote} -> {args.local}")
-    finally:
-        conn.close()
 
 
-def cmd_put(args, show_progress: bool = True, verbose: bool = False):
-    """Upload file"""
-    conn = SPXConnection(args.port, show_progress=show_progress, verbose=verbose)
-    try:
+def cmd_put(args, show_progress: bool = True, verbose: bool = False,
+            conn: Optional[SPXConnection] = None):
+    """Upload file (or directory tree with -r)"""
+    with _connection(args, show_progress, verbose, conn) as conn:
+        if args.recursive and os.path.isdir(args.local):
+            _put_tree(conn, args.local, args.remote, show_progress)
+            return
+        if not os.path.exists(args.local):
+            raise RSPNotFoundError(f"Local path not found: {args.local}")
+        # put -r on a plain file uploads just that file, like cp -r
         conn.put(args.local, args.remote)
         if not show_progress:
             print(f"Uploaded {args.local} -> {args.remote}")
-    finally:
-        conn.close()
 
 
-def cmd_rm(args, show_progress: bool = True, verbose: bool = False):
-    """Delete file"""
-    conn = SPXConnection(args.port, show_progress=show_progress, verbose=verbose)
-    try:
-        conn.rm(args.path)
-        print(f"Deleted {args.path}")
-    finally:
-        conn.close()
+def cmd_rm(args, show_progress: bool = True, verbose: bool = False,
+           conn: Optional[SPXConnection] = None) -> int:
+    """Delete files (or directory trees with -r)"""
+    with _connection(args, show_progress, verbose, conn) as conn:
+        if args.recursive:
+            for path in args.paths:
+                conn.rmtree(path)
+                print(f"Deleted {path}")
+            return 0
+        status = 0
+        for path, error in conn.rm_many(args.paths):
+            if error is not None:
+                print(f"Error: {error}", file=sys.stderr)
+                status = 1
+            else:
+                print(f"Deleted {path}")
+        return status
 
 
-def cmd_commit(args, show_progress: bool = True, verbose: bool = False):
+def cmd_commit(args, show_progress: bool = True, verbose: bool = False,
+               conn: Optional[SPXConnection] = None):
     """Commit file or directory to flash"""
-    conn = SPXConnection(args.port, show_progress=show_progress, verbose=verbose)
-    try:
+    with _connection(args, show_progress, verbose, conn) as conn:
         conn.commit(args.path)
         print(f"Committed {args.path} to flash")
-    finally:
-        conn.close()
 
 
-def cmd_mv(args, show_progress: bool = True, verbose: bool = False):
+def cmd_mv(args, show_progress: bool = True, verbose: bool = False,
+           conn: Optional[SPXConnection] = None):
     """Move/rename file"""
-    conn = SPXConnection(args.port, show_progress=show_progress, verbose=verbose)
-    try:
+    with _connection(args, show_progress, verbose, conn) as conn:
         conn.mv(args.old, args.new)
         print(f"Moved {args.old} -> {args.new}")
-    finally:
-        conn.close()
 
 
-def cmd_mkdir(args, show_progress: bool = True, verbose: bool = False):
+def cmd_mkdir(args, show_progress: bool = True, verbose: bool = False,
+              conn: Optional[SPXConnection] = None):
     """Create directory"""
-    conn = SPXConnection(args.port, show_progress=show_progress, verbose=verbose)
-    try:
+    with _connection(args, show_progress, verbose, conn) as conn:
         conn.mkdir(args.path)
         print(f"Created directory {args.path}")
-    finally:
-        conn.close()
 
 
-def cmd_rmdir(args, show_progress: bool = True, verbose: bool = False):
+def cmd_rmdir(args, show_progress: bool = True, verbose: bool = False,
+              conn: Optional[SPXConnection] = None):
     """Remove directory"""
-    conn = SPXConnection(args.port, show_progress=show_progress, verbose=verbose)
-    try:
+    with _connection(args, show_progress, verbose, conn) as conn:
         conn.rmdir(args.path)
         print(f"Removed directory {args.path}")
-    finally:
-        conn.close()
 
 
-def cmd_reboot(args, show_progress: bool = True, verbose: bool = False):
+def cmd_reboot(args, show_progress: bool = True, verbose: bool = False,
+               conn: Optional[SPXConnection] = None):
     """Trigger ZX Spectrum reboot"""
-    conn = SPXConnection(args.port, show_progress=show_progress, verbose=verbose)
-    try:
+    with _connection(args, show_progress, verbose, conn) as conn:
         conn.reboot()
         print("Reboot command sent")
-    finally:
-        conn.close()
 
 
-def cmd_autoboot(args, show_progress: bool = True, verbose: bool = False):
+def cmd_autoboot(args, show_progress: bool = True, verbose: bool = False,
+                 conn: Optional[SPXConnection] = None):
     """Configure autoboot from xfs://ram/ and reboot ZX Spectrum"""
     import signal
     import threading
     import time
     
-    conn = SPXConnection(args.port, show_progress=show_progress, verbose=verbose)
-    
     # Flag to track if we should continue streaming
     streaming = False
     should_stop = threading.Event()
@@ -1652,70 +1964,58 @@ def cmd_autoboot(args, show_progress: bool = True, verbose: bool = False):
             sys.exit(1)
     
     # Set up signal handler for Ctrl-C
-    signal.signal(signal.SIGINT, signal_handler)
+    previous_handler = signal.signal(signal.SIGINT, signal_handler)
     
     try:
-        # Check if follow mode is enabled
-        # When --follow is used without args, args.follow is True (const)
-        # When --follow is used with a number, args.follow is that int
-        follow_enabled = args.follow is not None
-        # If args.follow is True (const), follow forever (no time limit)
-        # If args.follow is an int, follow for that many seconds
-        if args.follow is True:
-            follow_seconds = None  # Follow forever
-        elif isinstance(args.follow, int):
-            follow_seconds = args.follow
-        else:
-            follow_seconds = None  # Shouldn't happen, but default to forever
+        with _connection(args, show_progress, verbose, conn) as conn:
+            # Check if follow mode is enabled
+            # When --follow is used without args, args.follow is True (const)
+            # When --follow is used with a number, args.follow is that int
+            follow_enabled = args.follow is not None
+            # If args.follow is True (const), follow forever (no time limit)
+            # If args.follow is an int, follow for that many seconds
+            if args.follow is True:
+                follow_seconds = None  # Follow forever
+            elif isinstance(args.follow, int):
+                follow_seconds = args.follow
+            else:
+                follow_seconds = None  # Shouldn't happen, but default to forever
 
-        # Call autoboot
-        conn.autoboot()
+            # Call autoboot
+            conn.autoboot()
         
-        if not follow_enabled:
-            # Normal mode: just print success and exit
-            print("Autoboot configured and reboot command sent")
-        else:
-            # Follow mode: stream output
-            streaming = True
-            if args.verbose:
-                if follow_seconds is not None:
-                    print(f"[Following terminal output for {follow_seconds} seconds]", file=sys.stderr)
-                else:
-                    print("[Following terminal output - Press Ctrl-C to stop]", file=sys.stderr)
+            if not follow_enabled:
+                # Normal mode: just print success and exit
+                print("Autoboot configured and reboot command sent")
+            else:
+                # Follow mode: stream output
+                streaming = True
+                if args.verbose:
+                    if follow_seconds is not None:
+                        print(f"[Following terminal output for {follow_seconds} seconds]", file=sys.stderr)
+                    else:
+                        print("[Following terminal output - Press Ctrl-C to stop]", file=sys.stderr)
             
-            # Set O-packet callback to stream output
-            conn.set_o_packet_callback(o_packet_handler)
+                # Set O-packet callback to stream output
+                conn.set_o_packet_callback(o_packet_handler)
             
-            # Keep connection alive and stream O-packets
-            try:
-                start_time = time.time()
-                while True:  # Loop forever until interrupted or time limit
-                    # Check if we should stop (Ctrl-C)
-                    if should_stop.is_set():
-                        break
-                    
-                    # Check if we've exceeded the time limit (if specified)
-                    if follow_seconds is not None:
-                        elapsed = time.time() - start_time
-                        if elapsed >= follow_seconds:
-                            break
-                    
-                    # Sleep to avoid busy-waiting
-                    time.sleep(0.1)
-            except KeyboardInterrupt:
-                print("\n[Interrupted]", file=sys.stderr)
-            finally:
-                conn.set_o_packet_callback(None)
+                # Keep connection alive and stream O-packets
+                try:
+                    # Until Ctrl-C or the time limit (if specified)
+                    _wait_for_stop(should_stop, follow_seconds)
+                except KeyboardInterrupt:
+                    print("\n[Interrupted]", file=sys.stderr)
+                finally:
+                    conn.set_o_packet_callback(None)
     finally:
-        conn.close()
+        signal.signal(signal.SIGINT, previous_handler)
 
 
-def cmd_exec(args, show_progress: bool = True, verbose: bool = False) -> int:
+def cmd_exec(args, show_progress: bool = True, verbose: bool = False,
+             conn: Optional[SPXConnection] = None) -> int:
     """Execute a CLI command on the device. Exit code 0 = success, 1 = failure (see firmware markers)."""
     import signal
 
-    conn = SPXConnection(args.port, show_progress=show_progress, verbose=verbose)
-
     streaming = False
     should_stop = threading.Event()
     pending = bytearray()
@@ -1750,74 +2050,123 @@ def cmd_exec(args, show_progress: bool = True, verbose: bool = False) -> int:
         else:
             sys.exit(1)
 
-    signal.signal(signal.SIGINT, signal_handler)
+    previous_handler = signal.signal(signal.SIGINT, signal_handler)
+
+    # On a shared connection (batch) the final reply must be consumed here, or the
+    # next command would read it as its own response
+    shared = conn is not None
 
     try:
-        follow_enabled = args.follow is not None
-        if args.follow is True:
-            follow_seconds = None
-        elif isinstance(args.follow, int):
-            follow_seconds = args.follow
-        else:
-            follow_seconds = None
+        with _connection(args, show_progress, verbose, conn) as conn:
+            try:
+                follow_enabled = args.follow is not None
+                if args.follow is True:
+                    follow_seconds = None
+                elif isinstance(args.follow, int):
+                    follow_seconds = args.follow
+                else:
+                    follow_seconds = None
 
-        # Before execute_command so O-packets during the command are not sent to default [LOG].
-        conn.set_o_packet_callback(o_packet_handler)
+                # Before execute_command so O-packets during the command are not sent to default [LOG].
+                conn.set_o_packet_callback(o_packet_handler)
 
-        response = conn.execute_command(
-            args.cmd,
-            wait_for_response=follow_enabled,
-            response_timeout=None if follow_enabled else None,
-        )
+                response = conn.execute_command(
+                    args.cmd,
+                    wait_for_response=follow_enabled or shared,
+                    response_timeout=None if follow_enabled else None,
+                )
 
-        if follow_enabled and response and response != "OK":
-            print(f"Error: {response}", file=sys.stderr)
-            return 1
+                if response and response != "OK":
+                    print(f"Error: {response}", file=sys.stderr)
+                    return 1
 
-        if exec_exit is not None:
-            return exec_exit
-
-        if follow_enabled:
-            streaming = True
-            if args.verbose:
-                if follow_seconds is not None:
-                    print(f"[Executing: {args.cmd}]", file=sys.stderr)
-                    print(f"[Following for {follow_seconds} seconds]", file=sys.stderr)
+                if exec_exit is not None:
+                    return exec_exit
+
+                if follow_enabled:
+                    streaming = True
+                    if args.verbose:
+                        if follow_seconds is not None:
+                            print(f"[Executing: {args.cmd}]", file=sys.stderr)
+                            print(f"[Following for {follow_seconds} seconds]", file=sys.stderr)
+                        else:
+                            print(f"[Executing: {args.cmd}]", file=sys.stderr)
+                            print("[Press Ctrl-C to stop]", file=sys.stderr)
+                    try:
+                        # The O-packet handler sets should_stop once the exec result marker arrives
+                        _wait_for_stop(should_stop, follow_seconds)
+                    except KeyboardInterrupt:
+                        print("\n[Interrupted]", file=sys.stderr)
                 else:
-                    print(f"[Executing: {args.cmd}]", file=sys.stderr)
-                    print("[Press Ctrl-C to stop]", file=sys.stderr)
-            try:
-                start_time = time.time()
-                while not should_stop.is_set() and exec_exit is None:
-                    if follow_seconds is not None:
-                        elapsed = time.time() - start_time
-                        if elapsed >= follow_seconds:
-                            break
-                    time.sleep(0.1)
-            except KeyboardInterrupt:
-                print("\n[Interrupted]", file=sys.stderr)
-        else:
-            # Without --follow, allow a short window for markers that arrive right after ACK.
-            deadline = time.time() + 1.0
-            while exec_exit is None and time.time() < deadline:
-                time.sleep(0.05)
+                    # Without --follow, allow a short window for markers that arrive right after ACK.
+                    _wait_for_stop(should_stop, 1.0)
+            finally:
+                if pending:
+                    print(pending.decode("utf-8", errors="replace"), end="", flush=True)
+                conn.set_o_packet_callback(None)
+
+        return exec_exit if exec_exit is not None else 0
     finally:
-        if pending:
-            print(pending.decode("utf-8", errors="replace"), end="", flush=True)
-        conn.set_o_packet_callback(None)
-        conn.close()
+        signal.signal(signal.SIGINT, previous_handler)
 
-    return exec_exit if exec_exit is not None else 0
 
+class _BatchLineParser(argparse.ArgumentParser):
+    """Parser for one batch line: raises instead of printing usage and exiting"""
 
-def main():
-    parser = argparse.ArgumentParser(description='SPX - Spectranext tool')
-    parser.add_argument('--port', '-p', help='Serial port (e.g., /dev/ttyACM0) or TCP address (e.g., localhost:1337). Auto-detect USB first, then fall back to localhost:1337 if not specified.')
-    parser.add_argument('--no-progress', action='store_true', help='Disable progress indicators')
-    parser.add_argument('--verbose', '-v', action='store_true', help='Log all data sent and received')
-    
-    subparsers = parser.add_subparsers(dest='command', help='Command')
-    
+    def error(self, message):
+        raise RSPInvalidError(message)
+
+
+def cmd_batch(args, show_progress: bool = True, verbose: bool = False) -> int:
+    """
+    Run spx commands read one per line from a file (or stdin) over a single connection.
+    Blank lines and # comments are skipped; stops at the first command that fails.
+    Global options (--port, --verbose, --no-progress) only go before "batch".
+    """
+    # Commands only, so a global option on a line is rejected rather than ignored
+    line_parser = _BatchLineParser(prog='spx batch', add_help=False)
+    _add_command_parsers(line_parser.add_subparsers(dest='command', required=True))
+    with _connection(args, show_progress, verbose) as conn:
+        for line_number, line in enumerate(args.file, 1):
+            try:
+                words = shlex.split(line, comments=True)
+                if not words:
+                    continue
+                if words[0].startswith('-'):
+                    raise RSPInvalidError(f"global option {words[0]} must go before 'batch'")
+                line_args = line_parser.parse_args(words)
+            except (ValueError, RSPInvalidError) as e:
+                raise RSPInvalidError(f"line {line_number}: {e}")
+            status = _run_command(line_args, show_progress, verbose, conn)
+            if status:
+                return status
+    return 0
+
+
+# Command name -> cmd_* function (all take args, show_progress, verbose, conn)
+_COMMANDS = {
+    'ls': cmd_ls,
+    'get': cmd_get,
+    'put': cmd_put,
+    'rm': cmd_rm,
+    'commit': cmd_commit,
+    'mv': cmd_mv,
+    'mkdir': cmd_mkdir,
+    'rmdir': cmd_rmdir,
+    'reboot': cmd_reboot,
+    'autoboot': cmd_autoboot,
+    'exec': cmd_exec,
+}
+
+
+def _run_command(args, show_progress: bool, verbose: bool,
+                 conn: Optional[SPXConnection] = None) -> int:
+    """Dispatch a parsed command; returns its exit status"""
+    return _COMMANDS[args.command](args, show_progress, verbose, conn) or 0
+
+
+def _add_command_parsers(subparsers):
+    """Add the device commands (everything but batch) to an argparse subparsers object"""
     # LS command
     parser_ls = subparsers.add_parser('ls', help='List directory')
     parser_ls.add_argument('path', nargs='?', default='/', help='Directory path')
@@ -1826,15 +2175,19 @@ def main():
     parser_get = subparsers.add_parser('get', help='Download file')
     parser_get.add_argument('remote', help='Remote file path')
     parser_get.add_argument('local', help='Local file path')
+    parser_get.add_argument('--recursive', '-r', action='store_true', help='Download a directory tree')
     
     # PUT command
     parser_put = subparsers.add_parser('put', help='Upload file')
     parser_put.add_argument('local', help='Local file path')
     parser_put.add_argument('remote', help='Remote file path')
+    parser_put.add_argument('--recursive', '-r', action='store_true', help='Upload a directory tree')
     
     # RM command
-    parser_rm = subparsers.add_parser('rm', help='Delete file')
-    parser_rm.add_argument('path', help='File path')
+    parser_rm = subparsers.add_parser('rm', help='Delete files')
+    parser_rm.add_argument('paths', nargs='+', metavar='path', help='File path')
+    parser_rm.add_argument('--recursive', '-r', action='store_true',
+                           help='Remove directories and their contents')
 
     # COMMIT command
     parser_commit = subparsers.add_parser('commit', help='Commit file or directory to flash')
@@ -1866,6 +2219,21 @@ def main():
     parser_exec.add_argument('cmd', metavar='command', help='Command to execute (e.g., "help", "wifi status")')
     parser_exec.add_argument('--follow', '-f', nargs='?', type=int, const=True, metavar='SECONDS',
                             help='Stream output continuously. If SECONDS is specified, follow for that many seconds then exit. If not specified, follow until Ctrl-C')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SPX - Spectranext tool')
+    parser.add_argument('--port', '-p', help='Serial port (e.g., /dev/ttyACM0) or TCP address (e.g., localhost:1337). Auto-detect USB first, then fall back to localhost:1337 if not specified.')
+    parser.add_argument('--no-progress', action='store_true', help='Disable progress indicators')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Log all data sent and received')
+    
+    subparsers = parser.add_subparsers(dest='command', help='Command')
+    _add_command_parsers(subparsers)
+    
+    # BATCH command
+    parser_batch = subparsers.add_parser('batch', help='Run commands from a file over one connection')
+    parser_batch.add_argument('file', nargs='?', type=argparse.FileType('r'), default='-',
+                              help='File with one spx command per line (default: - for stdin)')
     
     args = parser.parse_args()
     
@@ -1878,28 +2246,12 @@ def main():
     verbose = args.verbose
     
     try:
-        if args.command == 'ls':
-            cmd_ls(args, show_progress, verbose)
-        elif args.command == 'get':
-            cmd_get(args, show_progress, verbose)
-        elif args.command == 'put':
-            cmd_put(args, show_progress, verbose)
-        elif args.command == 'rm':
-            cmd_rm(args, show_progress, verbose)
-        elif args.command == 'commit':
-            cmd_commit(args, show_progress, verbose)
-        elif args.command == 'mv':
-            cmd_mv(args, show_progress, verbose)
-        elif args.command == 'mkdir':
-            cmd_mkdir(args, show_progress, verbose)
-        elif args.command == 'rmdir':
-            cmd_rmdir(args, show_progress, verbose)
-        elif args.command == 'reboot':
-            cmd_reboot(args, show_progress, verbose)
-        elif args.command == 'autoboot':
-            cmd_autoboot(args, show_progress, verbose)
-        elif args.command == 'exec':
-            sys.exit(cmd_exec(args, show_progress, verbose))
+        if args.command == 'batch':
+            status = cmd_batch(args, show_progress, verbose)
+        else:
+            status = _run_command(args, show_progress, verbose)
+        if status:
+            sys.exit(status)
     except RSPNotFoundError as e:
         print(f"Error: Not found - {e}", file=sys.stderr)
         sys.exit(1)